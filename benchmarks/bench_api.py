@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+End to end benchmark of Api methods against the stub server
+
+This file is part of python-directadmin.
+
+python-directadmin is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+python-directadmin is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with python-directadmin.  If not, see <http://www.gnu.org/licenses/>.
+
+Usage:
+python benchmarks/bench_api.py [options] [method ...]
+
+Starts benchmarks/stub_server.py in a separate process (unless
+--port is given) and calls every method the requested number of
+times, printing calls/sec, p50 and p99 latency and memory use.
+Every method runs in a fresh process of its own, so its peak
+memory, and its growth over the memory used before the first
+call, are not hidden by the methods run before it. The bytes
+received and decoded by every command are printed at the end.
+"""
+import os
+import sys
+import time
+import resource
+import threading
+import subprocess
+from optparse import OptionParser, SUPPRESS_HELP
+
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import directadmin
+
+# Method name -> function(api) performing one call
+METHODS = {'get_user_usage': lambda api: api.get_user_usage('user000001'), \
+           'get_user_limits': lambda api: api.get_user_limits('user000001'), \
+           'get_user_limits_typed': lambda api: \
+               api.get_user_limits('user000001', typed=True), \
+           'get_server_stats': lambda api: api.get_server_stats(), \
+           'suspend_account': lambda api: api.suspend_account('user000001'), \
+           'list_all_users': lambda api: api.list_all_users(), \
+           'stream_all_users': lambda api: \
+               sum(1 for user in api.stream_all_users())}
+
+DEFAULT_METHODS = ('get_user_usage', 'get_user_limits', 'get_server_stats', \
+                   'suspend_account', 'list_all_users', 'stream_all_users')
+
+def start_stub (entries, latency, gzip=False):
+    """Starts the stub server and returns (process, port)"""
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), \
+                          'stub_server.py')
+    arguments = [sys.executable, script, '-n', str(entries), \
+                 '-l', str(latency)]
+    if gzip:
+        arguments.append('-z')
+    process = subprocess.Popen(arguments, stdout=subprocess.PIPE)
+    return process, int(process.stdout.readline())
+
+def percentile (sorted_values, fraction):
+    """Returns the value at a fraction (0-1) of a sorted list"""
+    index = int(round(fraction * (len(sorted_values) - 1)))
+    return sorted_values[index]
+
+def peak_memory ():
+    """Returns the peak resident memory of this process in MB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, Mac OS X bytes
+    if sys.platform == 'darwin':
+        return peak / 1048576.0
+    return peak / 1024.0
+
+def run (api, call, calls, threads):
+    """Calls a method `calls` times spread over `threads` threads.
+       Returns (elapsed seconds, sorted list of latencies)"""
+    latencies = []
+    lock = threading.Lock()
+    per_thread = [calls // threads] * threads
+    for n in range(calls % threads):
+        per_thread[n] += 1
+
+    def worker (count):
+        measured = []
+        for n in range(count):
+            start = time.time()
+            call(api)
+            measured.append(time.time() - start)
+        lock.acquire()
+        try:
+            latencies.extend(measured)
+        finally:
+            lock.release()
+
+    workers = [threading.Thread(target=worker, args=(count,)) \
+               for count in per_thread]
+    start = time.time()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.time() - start
+    latencies.sort()
+    return elapsed, latencies
+
+def measure (option, port, name):
+    """Runs a method in this process and returns a dictionary
+       with its calls, elapsed seconds, latencies, memory and
+       bytes received and decoded by command"""
+    metrics = directadmin.Metrics()
+    api = directadmin.Api('admin', 'password', '127.0.0.1', port, \
+                          pool_size=option.pool_size, \
+                          use_json=option.json, metrics=metrics)
+    calls = option.calls
+    if 'list' in name or 'stream' in name:
+        calls = option.list_calls
+    before = peak_memory()
+    elapsed, latencies = run(api, METHODS[name], calls, option.threads)
+    peak = peak_memory()
+    api.close()
+    commands = metrics.as_dict()
+    return {'calls': calls, \
+            'elapsed': elapsed, \
+            'p50': percentile(latencies, 0.5), \
+            'p99': percentile(latencies, 0.99), \
+            'peak': peak, \
+            'growth': peak - before, \
+            'bytes': dict((cmd, (commands[cmd]['bytes_received'], \
+                                 commands[cmd]['bytes_decoded'])) \
+                          for cmd in commands)}
+
+def measure_in_child (option, port, name):
+    """Runs a method in a new process with the same options,
+       and returns the dictionary built there by measure()"""
+    arguments = [sys.executable, os.path.abspath(__file__), \
+                 '--child', '--port', str(port), \
+                 '-c', str(option.calls), '-L', str(option.list_calls), \
+                 '-t', str(option.threads), '-s', str(option.pool_size)]
+    if option.json:
+        arguments.append('-j')
+    arguments.append(name)
+    child = subprocess.Popen(arguments, stdout=subprocess.PIPE)
+    output = child.communicate()[0]
+    if child.returncode != 0:
+        sys.exit("%s failed" % name)
+    return json.loads(output)
+
+def main ():
+    parser = OptionParser(usage='%prog [options] [method ...]')
+    parser.add_option('-c', '--calls', dest='calls', type='int', \
+                      default=1000, help='calls per method (default: 1000)')
+    parser.add_option('-L', '--list-calls', dest='list_calls', type='int', \
+                      default=20, help='calls per list method (default: 20)')
+    parser.add_option('-t', '--threads', dest='threads', type='int', \
+                      default=1, help='threads calling at once (default: 1)')
+    parser.add_option('-n', '--entries', dest='entries', type='int', \
+                      default=50000, help='items of list responses (default: 50000)')
+    parser.add_option('-l', '--latency', dest='latency', type='float', \
+                      default=0, help='milliseconds added by the server (default: 0)')
+    parser.add_option('-s', '--pool-size', dest='pool_size', type='int', \
+                      default=0, help='keep-alive pool size, 0 disables it (default: 0)')
+    parser.add_option('-j', '--json', dest='json', action='store_true', \
+                      default=False, help='request JSON responses')
+    parser.add_option('-z', '--gzip', dest='gzip', action='store_true', \
+                      default=False, help='have the stub server gzip responses')
+    parser.add_option('-p', '--port', dest='port', type='int', default=0, \
+                      help='use a stub server already listening on this port')
+    parser.add_option('--child', dest='child', action='store_true', \
+                      default=False, help=SUPPRESS_HELP)
+    (option, args) = parser.parse_args()
+
+    methods = args or DEFAULT_METHODS
+    for name in methods:
+        if name not in METHODS:
+            parser.error("unknown method: %s (choose from %s)" % \
+                         (name, ', '.join(sorted(METHODS))))
+
+    # Measuring a single method for the parent process
+    if option.child:
+        print json.dumps(measure(option, option.port, methods[0]))
+        return 0
+
+    process = None
+    port = option.port
+    if not port:
+        process, port = start_stub(option.entries, option.latency, \
+                                   option.gzip)
+    try:
+        received = {}
+        print "%-22s %7s %10s %10s %10s %10s %12s" % \
+              ("method", "calls", "calls/s", "p50 (ms)", "p99 (ms)", \
+               "peak (MB)", "growth (MB)")
+        for name in methods:
+            result = measure_in_child(option, port, name)
+            print "%-22s %7d %10.1f %10.2f %10.2f %10.1f %12.1f" % \
+                  (name, result['calls'], result['calls'] / result['elapsed'], \
+                   result['p50'] * 1000, result['p99'] * 1000, \
+                   result['peak'], result['growth'])
+            for cmd, (raw, decoded) in result['bytes'].items():
+                total = received.get(cmd, (0, 0))
+                received[cmd] = (total[0] + raw, total[1] + decoded)
+        print
+        print "%-26s %14s %14s" % ("command", "received (B)", "decoded (B)")
+        for cmd in sorted(received):
+            print "%-26s %14d %14d" % (cmd, received[cmd][0], \
+                                       received[cmd][1])
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmark of crawling a fleet with threads and with processes
+
+This file is part of python-directadmin.
+
+python-directadmin is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+python-directadmin is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with python-directadmin.  If not, see <http://www.gnu.org/licenses/>.
+
+Usage:
+python benchmarks/bench_crawler.py [-s SERVERS] [-n ENTRIES] [-r ROUNDS]
+                                   [-P PROCESSES]
+
+Starts SERVERS copies of benchmarks/stub_server.py, each one in
+its own process, and lists the users of all of them ROUNDS times,
+first with a Fleet (threads in this process) and then with a
+FleetCrawler for every number of processes given (comma separated,
+default 1, 2 and the number of cores). Only the number of users of
+every server is sent back to the parent. Prints servers crawled per
+second; with big listings parsing dominates, so the crawler should
+scale with the cores available.
+"""
+import os
+import sys
+import time
+import subprocess
+import multiprocessing
+from optparse import OptionParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import directadmin
+
+def start_stubs (count, entries):
+    """Starts the stub servers and returns (processes, ports)"""
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), \
+                          'stub_server.py')
+    processes = []
+    ports = []
+    for n in range(count):
+        process = subprocess.Popen([sys.executable, script, \
+                                    '-n', str(entries)], \
+                                   stdout=subprocess.PIPE)
+        processes.append(process)
+        ports.append(int(process.stdout.readline()))
+    return processes, ports
+
+def check (results, errors, entries):
+    """Exits if any server failed or returned a wrong count"""
+    for server, error in errors.items():
+        sys.exit("%s failed: %s" % (server, error))
+    for server, count in results.items():
+        if count != entries:
+            sys.exit("%s returned %d users" % (server, count))
+
+def main ():
+    parser = OptionParser(usage='%prog [options]')
+    parser.add_option('-s', '--servers', dest='servers', type='int', \
+                      default=8, help='stub servers (default: 8)')
+    parser.add_option('-n', '--entries', dest='entries', type='int', \
+                      default=50000, help='users per server (default: 50000)')
+    parser.add_option('-r', '--rounds', dest='rounds', type='int', \
+                      default=3, help='crawls per configuration (default: 3)')
+    parser.add_option('-P', '--processes', dest='processes', default=None, \
+                      help='comma separated process counts')
+    (option, args) = parser.parse_args()
+    cores = multiprocessing.cpu_count()
+    if option.processes:
+        counts = [int(count) for count in option.processes.split(',')]
+    else:
+        counts = sorted(set([1, 2, cores]))
+
+    stubs, ports = start_stubs(option.servers, option.entries)
+    try:
+        servers = dict(('stub%02d' % n, {'hostname': '127.0.0.1', \
+                                         'port': port, \
+                                         'username': 'admin', \
+                                         'password': 'password'}) \
+                       for n, port in enumerate(ports))
+        total = option.servers * option.rounds
+        print "%d servers of %d users, %d cores" % \
+              (option.servers, option.entries, cores)
+        print "%-24s %10s %12s" % ("mode", "seconds", "servers/s")
+
+        fleet = directadmin.Fleet(servers, concurrency=option.servers)
+        start = time.time()
+        for n in range(option.rounds):
+            results, errors = fleet.run_all('list_all_users')
+            check(dict((server, len(users)) \
+                       for server, users in results.items()), \
+                  errors, option.entries)
+        elapsed = time.time() - start
+        fleet.close()
+        print "%-24s %10.2f %12.1f" % ("fleet (threads)", elapsed, \
+                                       total / elapsed)
+
+        for count in counts:
+            crawler = directadmin.FleetCrawler(servers, processes=count)
+            start = time.time()
+            for n in range(option.rounds):
+                results, errors = crawler.crawl_all('list_all_users', \
+                                                    reduce=len)
+                check(results, errors, option.entries)
+            elapsed = time.time() - start
+            crawler.close()
+            print "%-24s %10.2f %12.1f" % \
+                  ("crawler (%d processes)" % count, elapsed, total / elapsed)
+    finally:
+        for stub in stubs:
+            stub.terminate()
+            stub.wait()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Microbenchmark of the per call overhead of the client
+
+This file is part of python-directadmin.
+
+python-directadmin is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+python-directadmin is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with python-directadmin.  If not, see <http://www.gnu.org/licenses/>.
+
+Usage:
+python benchmarks/bench_overhead.py [-n CALLS] [-r REPEAT]
+
+Sends commands through a transport answering from memory with
+prebuilt responses, so no time is spent on the network and what is
+measured is the work the client does per call: building the
+parameters, the headers and the path, classifying the command and
+parsing a small response. Prints the best of REPEAT runs in
+microseconds per call.
+"""
+import os
+import sys
+import time
+import httplib
+from StringIO import StringIO
+from optparse import OptionParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import directadmin
+
+RESPONSES = {'CMD_API_SHOW_USER_USAGE': 'bandwidth=1024.5&quota=512.2', \
+             'CMD_API_SELECT_USERS': 'error=0&text=Success&details=Done', \
+             'CMD_API_POP': 'list[]=info&list[]=sales', \
+             'CMD_API_ADMIN_STATS': 'bandwidth=102400&nusers=100'}
+
+class CannedResponse (object):
+    """Response with headers parsed in advance"""
+    status = 200
+    reason = 'OK'
+
+    def __init__ (self, headers, body):
+        self._headers = headers
+        self._body = body
+
+    def info (self):
+        return self._headers
+
+    def read (self, amt=None):
+        body = self._body
+        if amt is None:
+            self._body = ''
+            return body
+        self._body = body[amt:]
+        return body[:amt]
+
+    def close (self):
+        pass
+
+class CannedTransport (object):
+    """Transport answering every command with a canned body,
+       spending as little time as possible on it"""
+    def __init__ (self, responses):
+        self._responses = responses
+        self._headers = httplib.HTTPMessage(StringIO(\
+                            "Content-Type: text/plain\r\n\r\n"))
+
+    def open (self, method, path, body=None, headers=None, stream=False, \
+              timeout=None):
+        cmd = path[1:].split('?', 1)[0]
+        return CannedResponse(self._headers, self._responses[cmd])
+
+    def stats (self):
+        return None
+
+    def close (self):
+        pass
+
+# Name -> function(api) performing one call
+CALLS = (('get_user_usage', lambda api: api.get_user_usage('user1')), \
+         ('suspend_account', lambda api: api.suspend_account('user1')), \
+         ('list_pop_accounts', \
+          lambda api: api.list_pop_accounts('example.com')), \
+         ('get_server_stats', lambda api: api.get_server_stats()))
+
+def measure (api, call, calls, repeat):
+    """Returns the best time per call, in seconds, of repeat runs"""
+    best = None
+    for n in range(repeat):
+        start = time.time()
+        for m in xrange(calls):
+            call(api)
+        elapsed = (time.time() - start) / calls
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+def main ():
+    parser = OptionParser(usage='%prog [options]')
+    parser.add_option('-n', '--calls', dest='calls', type='int', \
+                      default=20000, help='calls per run (default: 20000)')
+    parser.add_option('-r', '--repeat', dest='repeat', type='int', \
+                      default=5, help='runs per method (default: 5)')
+    (option, args) = parser.parse_args()
+
+    api = directadmin.Api('admin', 'password', \
+                          transport=CannedTransport(RESPONSES))
+    print "%-20s %12s" % ("method", "us/call")
+    for name, call in CALLS:
+        print "%-20s %12.2f" % \
+              (name, measure(api, call, option.calls, option.repeat) * 1e6)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Microbenchmark of the response parsers: url-encoded vs JSON
+
+This file is part of python-directadmin.
+
+python-directadmin is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+python-directadmin is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with python-directadmin.  If not, see <http://www.gnu.org/licenses/>.
+
+Usage:
+python benchmarks/bench_parsers.py [-n ENTRIES] [-r REPEAT]
+
+Builds large list[] and key=value payloads in both formats
+and times ApiConnector._handle_response on each of them.
+"""
+import os
+import sys
+import time
+import urllib
+import mimetools
+from StringIO import StringIO
+from optparse import OptionParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import directadmin
+from directadmin.api import json
+
+class FakeResponse (object):
+    """In-memory response with the interface of urllib2's"""
+    def __init__ (self, body):
+        self._body = body
+        self._headers = mimetools.Message(StringIO(""))
+
+    def info (self):
+        return self._headers
+
+    def read (self, amt=None):
+        return self._body
+
+def build_payloads (entries):
+    """Returns a dictionary of name -> (url-encoded body, JSON body)"""
+    users = ['user%06d' % n for n in range(entries)]
+    stats = dict(('key%d' % n, str(n * 1024)) for n in range(entries))
+    return {'list': (urllib.urlencode([('list[]', u) for u in users]), \
+                     json.dumps(users)), \
+            'dict': (urllib.urlencode(stats.items()), \
+                     json.dumps(stats))}
+
+def timeit (connector, body, repeat):
+    """Returns the best time of `repeat` runs"""
+    best = None
+    for n in range(repeat):
+        start = time.time()
+        connector._handle_response(FakeResponse(body))
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+def main ():
+    parser = OptionParser(usage='%prog [options]')
+    parser.add_option('-n', '--entries', dest='entries', type='int', \
+                      default=50000, help='entries per payload (default: 50000)')
+    parser.add_option('-r', '--repeat', dest='repeat', type='int', \
+                      default=5, help='runs per measure (default: 5)')
+    (option, args) = parser.parse_args()
+
+    connector = directadmin.ApiConnector('admin', 'password', use_json=True)
+    print "JSON module: %s" % json.__name__
+    print "%-6s %-8s %12s %12s" % ("shape", "format", "bytes", "best (ms)")
+    for shape, (urlencoded, js) in sorted(build_payloads(option.entries).items()):
+        for name, body in (("urlenc", urlencoded), ("json", js)):
+            best = timeit(connector, body, option.repeat)
+            print "%-6s %-8s %12d %12.2f" % (shape, name, len(body), best * 1000)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Stress check of an Api object shared by many threads
+
+This file is part of python-directadmin.
+
+python-directadmin is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+python-directadmin is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with python-directadmin.  If not, see <http://www.gnu.org/licenses/>.
+
+Usage:
+python benchmarks/stress_threads.py [-t THREADS] [-n CALLS] [-T TRANSPORT]
+
+Runs concurrent create_user, list_all_users and get_user_usage
+calls through a single Api object against an in-process stub
+server which checks that every create_user request carries the
+properties of its own user, and answers get_user_usage with the
+user it was asked about. Any mixed up request or response is
+reported, and the exit status is 1 if there was any.
+"""
+import os
+import sys
+import time
+import threading
+import urlparse
+from optparse import OptionParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import directadmin
+from stub_server import StubServer, StubHandler
+
+class CheckingHandler (StubHandler):
+    """Stub handler that validates create_user requests
+       and echoes the user of get_user_usage requests"""
+    def respond (self, cmd, query, data):
+        options = dict(urlparse.parse_qsl(data or ''))
+        if cmd == 'CMD_API_ACCOUNT_USER':
+            username = options.get('username', '')
+            if options.get('email') != '%s@example.com' % username or \
+               options.get('domain') != '%s.com' % username or \
+               options.get('passwd') != 'pw%s' % username:
+                return 'error=1&text=Mixed%20up%20request', 'text/plain'
+            return 'error=0&text=Created', 'text/plain'
+        if cmd == 'CMD_API_SHOW_USER_USAGE':
+            return 'quota=1&echo=%s' % options.get('user'), 'text/plain'
+        return StubHandler.respond(self, cmd, query, data)
+
+def make_transport (name, port):
+    """Returns the transport for a name given in the command line"""
+    if name == 'urllib':
+        return directadmin.UrllibTransport('127.0.0.1', port)
+    if name == 'pooled':
+        return directadmin.PooledTransport('127.0.0.1', port, size=8)
+    return directadmin.ThreadLocalTransport('127.0.0.1', port)
+
+def worker (api, number, calls, entries, errors):
+    """Sends calls commands, appending any problem to errors"""
+    for n in range(calls):
+        username = 'u%03d%03d' % (number, n % 1000)
+        try:
+            if n % 3 == 0:
+                user = directadmin.EndUser(username, \
+                                           '%s@example.com' % username, \
+                                           'pw%s' % username, \
+                                           '%s.com' % username)
+                api.create_user(user, False)
+            elif n % 3 == 1:
+                users = api.list_all_users()
+                if len(users) != entries:
+                    errors.append("list_all_users returned %d users" % \
+                                  len(users))
+            else:
+                usage = api.get_user_usage(username)
+                if usage.get('echo') != [username]:
+                    errors.append("usage of %s returned for %s" % \
+                                  (usage.get('echo'), username))
+        except directadmin.ApiError, e:
+            errors.append("%s: %s" % (username, e))
+
+def main ():
+    parser = OptionParser(usage='%prog [options]')
+    parser.add_option('-t', '--threads', dest='threads', type='int', \
+                      default=32, help='threads sharing the Api (default: 32)')
+    parser.add_option('-n', '--calls', dest='calls', type='int', \
+                      default=300, help='calls per thread (default: 300)')
+    parser.add_option('-e', '--entries', dest='entries', type='int', \
+                      default=100, help='items of list responses (default: 100)')
+    parser.add_option('-T', '--transport', dest='transport', \
+                      default='threadlocal', \
+                      help='urllib, pooled or threadlocal (default: threadlocal)')
+    (option, args) = parser.parse_args()
+    if option.transport not in ('urllib', 'pooled', 'threadlocal'):
+        parser.error("unknown transport: %s" % option.transport)
+
+    server = StubServer(('127.0.0.1', 0), option.entries, \
+                        handler=CheckingHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.setDaemon(True)
+    thread.start()
+    port = server.server_address[1]
+
+    api = directadmin.Api('admin', 'password', '127.0.0.1', port, \
+                          transport=make_transport(option.transport, port))
+    errors = []
+    threads = [threading.Thread(target=worker, \
+                                args=(api, n, option.calls, \
+                                      option.entries, errors)) \
+               for n in range(option.threads)]
+    start = time.time()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.time() - start
+    api.close()
+    server.shutdown()
+
+    total = option.threads * option.calls
+    print "%d calls from %d threads in %.2fs (%.0f calls/s), %d errors" % \
+          (total, option.threads, elapsed, total / elapsed, len(errors))
+    for error in errors[:10]:
+        print "  %s" % error
+    if errors:
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
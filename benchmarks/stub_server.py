@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Stub Directadmin server for benchmarks
+
+This file is part of python-directadmin.
+
+python-directadmin is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+python-directadmin is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with python-directadmin.  If not, see <http://www.gnu.org/licenses/>.
+
+Usage:
+python benchmarks/stub_server.py [-p PORT] [-n ENTRIES] [-l LATENCY] [-z]
+
+Serves canned responses in Directadmin's url-encoded format (or
+JSON when asked with json=yes) over HTTP/1.1 with keep-alive, so
+the client can be measured end to end without a real panel.
+List commands return ENTRIES items and every response is delayed
+by LATENCY milliseconds. With -z, responses are gzip encoded for
+clients that accept it. Any credentials are accepted.
+
+Once listening, the port is printed on the first line of stdout.
+"""
+import sys
+import time
+import zlib
+import urllib
+import urlparse
+import BaseHTTPServer
+import SocketServer
+from optparse import OptionParser
+
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+# Commands answered with a list[] of ENTRIES items
+LIST_COMMANDS = ('CMD_API_SHOW_ALL_USERS', 'CMD_API_SHOW_USERS', \
+                 'CMD_API_SHOW_RESELLERS', 'CMD_API_SHOW_DOMAINS', \
+                 'CMD_API_SUBDOMAINS', 'CMD_API_POP', 'CMD_API_DATABASES')
+
+USAGE = [('bandwidth', '1024.5'), ('quota', '512.2'), ('vdomains', '1'), \
+         ('nsubdomains', '3'), ('nemails', '12'), ('nemailf', '0'), \
+         ('nemailml', '0'), ('nemailr', '2'), ('mysql', '1'), \
+         ('domainptr', '0'), ('ftp', '1'), ('db_quota', '2048'), \
+         ('email_quota', '4096'), ('email_deliveries', '10'), \
+         ('inode', '2345')]
+
+LIMITS = [('bandwidth', 'unlimited'), ('quota', '1000'), ('vdomains', '1'), \
+          ('nsubdomains', 'unlimited'), ('nemails', '100'), ('mysql', '5'), \
+          ('ftp', '1'), ('suspended', 'no'), ('creator', 'admin'), \
+          ('package', 'basic'), ('ip', '127.0.0.1'), ('usertype', 'user'), \
+          ('email', 'user@example.com'), ('domain', 'example.com')]
+
+STATS = [('bandwidth', '102400'), ('quota', '51200'), ('nusers', '100'), \
+         ('nresellers', '2'), ('ndomains', '120'), ('loadavg', '0.10 0.20 0.30'), \
+         ('disk1', '/dev/sda1:100000:50000:50000:50%:/'), \
+         ('disk2', '/dev/sdb1:200000:20000:180000:10%:/home')]
+
+class Payloads (object):
+    """Response bodies, built once and shared by all requests"""
+    def __init__ (self, entries):
+        items = ['user%06d' % n for n in range(entries)]
+        self.list = urllib.urlencode([('list[]', item) for item in items])
+        self.list_json = json.dumps(items)
+        self.usage = urllib.urlencode(USAGE)
+        self.limits = urllib.urlencode(LIMITS)
+        self.stats = urllib.urlencode(STATS)
+        self.ok = urllib.urlencode([('error', '0'), ('text', 'Success'), \
+                                    ('details', 'Done')])
+
+        self._compressed = {}
+
+    def compress (self, body):
+        """Returns a body gzip encoded, compressing it only once"""
+        compressed = self._compressed.get(body)
+        if compressed is None:
+            compressor = zlib.compressobj(6, zlib.DEFLATED, \
+                                          16 + zlib.MAX_WBITS)
+            compressed = compressor.compress(body) + compressor.flush()
+            self._compressed[body] = compressed
+        return compressed
+
+    def get (self, cmd, json_mode):
+        """Returns the body and content type for a command"""
+        if cmd in LIST_COMMANDS:
+            if json_mode:
+                return self.list_json, 'application/json'
+            return self.list, 'text/plain'
+        if cmd == 'CMD_API_SHOW_USER_USAGE':
+            body = self.usage
+        elif cmd == 'CMD_API_SHOW_USER_CONFIG':
+            body = self.limits
+        elif cmd == 'CMD_API_ADMIN_STATS':
+            body = self.stats
+        else:
+            body = self.ok
+        if json_mode:
+            return json.dumps(dict(urlparse.parse_qsl(body))), \
+                   'application/json'
+        return body, 'text/plain'
+
+class StubHandler (BaseHTTPServer.BaseHTTPRequestHandler):
+    """Answers every command with a canned response"""
+    protocol_version = "HTTP/1.1"
+    # Send the headers and body of a response in one packet,
+    # otherwise delayed ACKs dominate the measures
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def log_message (self, format, *args):
+        pass
+
+    def do_GET (self):
+        self._reply(None)
+
+    def do_POST (self):
+        length = int(self.headers.getheader('Content-Length') or 0)
+        self._reply(self.rfile.read(length))
+
+    def respond (self, cmd, query, data):
+        """Returns the body and content type of the response to a
+           command, data being the request body (None for GET)"""
+        return self.server.payloads.get(cmd, 'json=yes' in query)
+
+    def _reply (self, data):
+        path, _, query = self.path.lstrip('/').partition('?')
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        body, content_type = self.respond(path, query, data)
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        if self.server.compress and \
+           'gzip' in (self.headers.getheader('Accept-Encoding') or ''):
+            body = self.server.payloads.compress(body)
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+class StubServer (SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """Stub Server
+
+    Threaded HTTP server answering like Directadmin.
+
+    Parameters:
+    address -- (host, port) tuple, port 0 picks a free one
+    entries -- number of items of list responses (default: 1000)
+    latency -- seconds every response is delayed (default: 0)
+    handler -- request handler class (default: StubHandler)
+    compress -- boolean, if True responses are gzip encoded for
+                the clients that accept it (default: False)
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__ (self, address, entries=1000, latency=0, \
+                  handler=StubHandler, compress=False):
+        BaseHTTPServer.HTTPServer.__init__(self, address, handler)
+        self.payloads = Payloads(entries)
+        self.latency = latency
+        self.compress = compress
+
+def main ():
+    parser = OptionParser(usage='%prog [options]')
+    parser.add_option('-H', '--host', dest='host', default='127.0.0.1', \
+                      help='address to listen on (default: 127.0.0.1)')
+    parser.add_option('-p', '--port', dest='port', type='int', default=0, \
+                      help='port to listen on (default: any free port)')
+    parser.add_option('-n', '--entries', dest='entries', type='int', \
+                      default=1000, help='items of list responses (default: 1000)')
+    parser.add_option('-l', '--latency', dest='latency', type='float', \
+                      default=0, help='milliseconds added to every response (default: 0)')
+    parser.add_option('-z', '--gzip', dest='gzip', action='store_true', \
+                      default=False, help='gzip responses when accepted')
+    (option, args) = parser.parse_args()
+
+    server = StubServer((option.host, option.port), option.entries, \
+                        option.latency / 1000.0, compress=option.gzip)
+    print server.server_address[1]
+    sys.stdout.flush()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
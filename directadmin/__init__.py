@@ -1,2 +1,17 @@
 # -*- coding: utf-8 -*-
 from api import *
+from futures import Future, CancelledError, TimeoutError, as_completed, wait_all
+from fleet import Fleet, FleetResult, read_servers_config
+from cache import ResponseCache, SingleFlight
+from records import ServerStats, DiskInfo, UserUsage, UserLimits
+from ratelimit import TokenBucket, AdaptiveLimiter
+from retry import RetryPolicy, DEFAULT_VERIFIERS
+from metrics import Metrics
+from transport import UrllibTransport, PooledTransport, ThreadLocalTransport, \
+                      FakeTransport, \
+                      RecordingTransport, ReplayTransport
+from inventory import Inventory
+from reconcile import Reconciler, Plan, Action, ReconcileResult
+from batch import SuspensionBatcher
+from deadline import Deadline
+from crawler import FleetCrawler
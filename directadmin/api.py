@@ -39,9 +39,38 @@ import urllib2
 import urllib
 import urlparse
 import base64
+import sys
+import time
+import socket
+import httplib
+import zlib
+try:
+    import simplejson as json
+except ImportError:
+    import json
+from transport import UrllibTransport, PooledTransport
+from futures import Future, WorkerPool, TimeoutError, as_completed
+from deadline import current_deadline
+from cache import SingleFlight
+from records import ServerStats, UserUsage, UserLimits
+from commands import COMMANDS, encode
 
 _user_agent = "Python Directadmin"
 
+# Content encodings that can be decompressed as they are read
+_accept_encoding = "gzip, deflate"
+
+def is_read_only (cmd, parameters=None):
+    """Is read only
+
+    Returns True if a command, with the given parameters,
+    only reads information from the server
+    """
+    command = COMMANDS.get(cmd)
+    if command is None:
+        return False
+    return command.is_read_only(parameters)
+
 class ApiError (Exception):
     """API Error
 
@@ -49,15 +78,41 @@ class ApiError (Exception):
     """
     pass
 
+class ApiHttpError (ApiError):
+    """API HTTP Error
+
+    Raised when a command could not be sent or its response
+    could not be read: network failures and HTTP errors.
+    status holds the HTTP status code, if there was one, and
+    network is True for socket errors, timeouts and lost
+    connections, as opposed to responses that cannot be read.
+    """
+    def __init__ (self, message, status=None, network=False):
+        ApiError.__init__(self, message)
+        self.status = status
+        self.network = network
+
+class DeadlineExceeded (ApiError):
+    """Deadline Exceeded
+
+    Raised when a command is not sent, or its response is not
+    received, before the deadline it runs under (see Deadline)
+    """
+    pass
+
+class ApiAuthError (ApiError):
+    """API Authentication Error
+
+    Raised when Directadmin rejects the username or password
+    """
+    pass
+
 class User (object):
     """User
 
     Abstract representation of a Directadmin Panel User
     """
-    _properties = {'username': None, \
-                   'email': None, \
-                   'passwd': None, \
-                   'passwd2': None}
+    _properties = None
 
     def __init__ (self, username, email, password):
         """Constructor
@@ -70,10 +125,11 @@ class User (object):
         email -- a valid email address
         password -- Admin's password, +5 ascii characters
         """
-        self._properties['username'] = username
-        self._properties['email'] = email
-        self._properties['passwd'] = password
-        self._properties['passwd2'] = password
+        # Each instance has its own properties
+        self._properties = {'username': username, \
+                            'email': email, \
+                            'passwd': password, \
+                            'passwd2': password}
 
     def __getitem__ (self, key):
         """Returns a user property"""
@@ -218,7 +274,7 @@ class ResellerUser (User):
                            server's main ip. assign will use one of the reseller's ips
                            (default: shared)
         """
-        super(User, self).__init__(username, email, password)
+        super(ResellerUser, self).__init__(username, email, password)
         self['domain'] = domain
         self['ip'] = ip
         if package is not None:
@@ -370,7 +426,7 @@ class EndUser (User):
         ip              -- One of the ips which is available for user creation. 
                            Only free or shared ips are allowed.
         """
-        super(User, self).__init__(username, email, password)
+        super(EndUser, self).__init__(username, email, password)
         self['domain'] = domain
         self['ip'] = ip
         if package is not None:
@@ -417,24 +473,169 @@ class EndUser (User):
                 'sysinfo': "OFF", 
                 'dnscontrol': "OFF"}
 
+class UserHandle (object):
+    """User Handle
+
+    Lightweight reference to a user, yielded by Api.iter_users.
+    Its usage, limits and domains are fetched from the server
+    on first access (unless they were prefetched) and memoized.
+    """
+    __slots__ = ('username', '_api', '_typed', '_details', '_deadline')
+
+    def __init__ (self, api, username, typed=False, deadline=None):
+        self.username = username
+        self._api = api
+        self._typed = typed
+        self._details = {}
+        self._deadline = deadline
+
+    def _fetch (self, name):
+        """Fetches a detail of the user from the server,
+           under the deadline of the handle if it has one"""
+        if self._deadline is not None:
+            self._deadline.__enter__()
+            try:
+                return self._fetch_detail(name)
+            finally:
+                self._deadline.__exit__(None, None, None)
+        return self._fetch_detail(name)
+
+    def _fetch_detail (self, name):
+        """Sends the command of a detail"""
+        if name == 'usage':
+            return self._api.get_user_usage(self.username, self._typed)
+        if name == 'limits':
+            return self._api.get_user_limits(self.username, self._typed)
+        if name == 'domains':
+            return self._api.get_user_domains(self.username)
+        raise ValueError("unknown detail: %s" % name)
+
+    def _get (self, name):
+        """Returns a detail, waiting for it if it is being
+           prefetched, or fetching it if it is not known yet"""
+        value = self._details.get(name)
+        if isinstance(value, Future):
+            if value.cancelled():
+                value = None
+            else:
+                try:
+                    value = value.result()
+                except ApiError:
+                    # Forget the failure so the next access tries again
+                    del self._details[name]
+                    raise
+        if name not in self._details or value is None:
+            value = self._fetch(name)
+        self._details[name] = value
+        return value
+
+    def prefetch (self, pool, details=('usage', 'limits', 'domains')):
+        """Prefetch
+
+        Starts fetching the given details in a WorkerPool and
+        returns the futures submitted for the details not
+        already known
+        """
+        futures = []
+        for name in details:
+            if name not in self._details:
+                future = pool.submit(self._fetch, name)
+                self._details[name] = future
+                futures.append(future)
+        return futures
+
+    usage = property(lambda self: self._get('usage'), \
+                     doc="Usage of the user, see Api.get_user_usage")
+    limits = property(lambda self: self._get('limits'), \
+                      doc="Limits of the user, see Api.get_user_limits")
+    domains = property(lambda self: self._get('domains'), \
+                       doc="Domains of the user, see Api.get_user_domains")
+
+    def __repr__ (self):
+        return "<UserHandle %s>" % self.username
+
+class BulkResult (object):
+    """Bulk Result
+
+    Per user outcome of a bulk operation.
+
+    succeeded -- list of usernames on which the operation succeeded
+    failed -- dictionary of username -> ApiError for the users
+              on which the operation failed after all the retries
+    """
+    def __init__ (self):
+        self.succeeded = []
+        self.failed = {}
+
+    def ok (self):
+        """Returns True if the operation succeeded for every user"""
+        return len(self.failed) == 0
+
+    def failed_users (self):
+        """Returns the list of users that failed, which can
+           be passed again to resume the operation"""
+        return sorted(self.failed.keys())
+
 class ApiConnector (object):
     """API Connector
 
     Basic object to handle API connection.
     Connect and send commands.
+
+    If pool_size is greater than zero, commands are sent
+    through a pool of persistent (keep-alive) connections
+    instead of opening a new one for every command.
+
+    Requests are sent through a transport object (see the
+    transport module), which can be replaced to record,
+    replay or fake the server's responses.
+
+    Connectors are safe to share between threads: they keep no
+    per request state, and the transports, rate limiters and
+    metrics are thread-safe. Hooks should be registered before
+    the connector is shared.
+
+    Every request times out after `timeout` seconds, or
+    `write_timeout` for commands that modify the server, and
+    earlier if it runs under a Deadline that ends before; the
+    wait for the rate limiter is bounded by the Deadline too.
+
+    With compression, responses may come gzip or deflate
+    encoded; they are decompressed as they are read, and the
+    metrics record both the bytes received and the decoded ones.
     """
     _hostname = None
     _port = 0
     _username = None
     _password = None
     _https = False
+    _transport = None
+    _use_json = False
+    _limiter = None
+    _metrics = None
+    _pre_hooks = ()
+    _post_hooks = ()
+    _timeout = None
+    _write_timeout = None
+    _compression = True
+    _headers = None
+    _post_headers = None
 
     def __init__ (self, \
                   username, \
                   password, \
                   hostname="localhost", \
                   port=2222, \
-                  https=False):
+                  https=False, \
+                  pool_size=0, \
+                  pool_idle_timeout=60, \
+                  use_json=False, \
+                  rate_limiter=None, \
+                  metrics=None, \
+                  transport=None, \
+                  timeout=None, \
+                  write_timeout=None, \
+                  compression=True):
         """Constructor
 
         Parameters:
@@ -444,12 +645,60 @@ class ApiConnector (object):
         port = port on which Directadmin listens (default: 2222)
         https -- boolean, if True all transactions will
                  be performed using HTTPS (default: False)
+        pool_size -- maximum number of idle keep-alive connections
+                     kept open, zero disables pooling (default: 0)
+        pool_idle_timeout -- seconds after which an idle pooled
+                             connection is closed (default: 60)
+        use_json -- boolean, if True responses are requested in JSON
+                    format, falling back to the url-encoded format
+                    for servers that do not support it (default: False)
+        rate_limiter -- TokenBucket or AdaptiveLimiter object used to
+                        throttle the requests sent (default: None)
+        metrics -- Metrics object where the latency, size and errors
+                   of every command are recorded (default: None)
+        transport -- transport object the requests are sent through
+                     (default: None, a PooledTransport if pool_size
+                     is greater than zero, else an UrllibTransport)
+        timeout -- seconds a request may block on the network
+                   (default: None, the default socket timeout)
+        write_timeout -- timeout of the commands that modify the
+                         server (default: None, same as timeout)
+        compression -- boolean, if True gzip and deflate encoded
+                       responses are accepted (default: True)
         """
+        self._use_json = bool(use_json)
+        self._compression = bool(compression)
+        self._timeout = timeout
+        if write_timeout is None:
+            write_timeout = timeout
+        self._write_timeout = write_timeout
+        self._limiter = rate_limiter
+        self._metrics = metrics
         self._hostname = hostname
         self._port = int(port)
         self._username = username
         self._password = password
         self._https = bool(https)
+        # Headers are the same for every request, build them once
+        self._headers = {'Authorization': self._get_auth_header(), \
+                         'User-Agent': _user_agent}
+        if self._compression:
+            self._headers['Accept-Encoding'] = _accept_encoding
+        self._post_headers = dict(self._headers)
+        self._post_headers['Content-Type'] = \
+            "application/x-www-form-urlencoded"
+        if transport is not None:
+            self._transport = transport
+        elif pool_size > 0:
+            self._transport = PooledTransport(self._hostname, \
+                                              self._port, \
+                                              self._https, \
+                                              pool_size, \
+                                              pool_idle_timeout)
+        else:
+            self._transport = UrllibTransport(self._hostname, \
+                                              self._port, \
+                                              self._https)
 
     def execute (self, cmd, parameters=None):
        """Execute command
@@ -461,39 +710,264 @@ class ApiConnector (object):
        cmd = command name
        parameters = list of tuples with parameters (default: None)
        """
+       if self._metrics is None and not self._pre_hooks \
+          and not self._post_hooks:
+           return self._execute(cmd, parameters)
+
+       for hook in self._pre_hooks:
+           hook(cmd, parameters)
+       sent = 0
        if parameters is not None:
-           parameters = urllib.urlencode(parameters)
+           sent = len(encode(parameters))
+       # Bytes received, and bytes decoded if the body was compressed
+       received = [0, None]
+       result = error = None
+       start = time.time()
+       try:
+           result = self._execute(cmd, parameters, received)
+           return result
+       except Exception, e:
+           error = e
+           raise
+       finally:
+           latency = time.time() - start
+           if self._metrics is not None:
+               decoded = received[1]
+               if decoded is None:
+                   decoded = received[0]
+               self._metrics.record(cmd, latency, sent, received[0], error, \
+                                    decoded)
+           for hook in self._post_hooks:
+               hook(cmd, parameters, result, error, latency)
+
+    def _execute (self, cmd, parameters, received=None):
+       """Sends a command through the rate limiter, if any,
+          and handles its response. If received is given, the
+          bytes read are added to its first item, and the bytes
+          decoded from a compressed body to the second one"""
+       _check_deadline()
+       if self._limiter is None:
+           response = self._open(cmd, parameters)
+           return self._handle_response(_decode(response, received))
+
+       # Only HTTP level failures, reading the body included, are
+       # reported to the limiter, errors returned by the API do
+       # not mean overload
+       self._acquire()
+       start = time.time()
+       failed = True
+       try:
+           response = self._open(cmd, parameters)
+           result = self._handle_response(_decode(response, received))
+           failed = False
+           return result
+       except DeadlineExceeded:
+           # Given up by the client, says nothing about the server
+           failed = None
+           raise
+       except ApiHttpError:
+           raise
+       except ApiError:
+           failed = False
+           raise
+       finally:
+           self._limiter.release(time.time() - start, failed)
+
+    def _acquire (self):
+        """Takes a slot of the rate limiter, waiting no longer
+           than the current deadline allows"""
+        deadline = current_deadline()
+        if deadline is None:
+            self._limiter.acquire()
+        elif not self._limiter.acquire(deadline.remaining()):
+            raise DeadlineExceeded("Deadline exceeded waiting for " \
+                                   "the rate limiter")
+
+    def add_pre_request_hook (self, hook):
+        """Add pre request hook
+
+        Registers a function(cmd, parameters) called
+        before every command is sent
+        """
+        self._pre_hooks = self._pre_hooks + (hook,)
 
-       request = urllib2.Request(self._get_url(cmd), parameters)
+    def add_post_request_hook (self, hook):
+        """Add post request hook
 
-       # Directadmin's API requires Basic HTTP Authentication
-       base_auth = base64.b64encode("%s:%s" % \
-                                    (self._username, self._password))
-       request.add_header('Authorization', 'Basic %s' % base_auth)
+        Registers a function(cmd, parameters, result, error, latency)
+        called after every command, with the error raised (or None)
+        and the seconds the command took
+        """
+        self._post_hooks = self._post_hooks + (hook,)
 
-       # Identify our app with a custom User-Agent
-       request.add_header('User-Agent', _user_agent)
+    def execute_stream (self, cmd, parameters=None, chunk_size=65536):
+        """Execute command as a stream
 
-       # Open the URL and handle the response
-       try:
-           return self._handle_response(urllib2.urlopen(request))
-       except urllib2.URLError, e:
-           raise ApiError("HTTP Error: %s" % e.reason)
+        Executes a command of the API and yields the items of
+        its 'list[]' as they are decoded from the socket, so
+        the whole response is never held in memory.
+
+        The error flag is checked once the body has been
+        completely read, raising ApiError on errors.
 
-    def _get_url (self, cmd):
-        """Get URL
+        With a rate limiter, the slot of the stream is held until
+        the body has been read, so failures reading it are
+        reported; the latency reported is the time until the
+        headers arrived.
 
-        Returns the URL for a specific command
+        Parameters:
+        cmd = command name
+        parameters = list of tuples with parameters (default: None)
+        chunk_size = bytes read from the socket at once (default: 65536)
         """
-        if self._https:
-            protocol = "https"
+        _check_deadline()
+        if self._limiter is not None:
+            self._acquire()
+        start = time.time()
+        latency = None
+        failed = True
+        response = None
+        try:
+            response = _decode(self._open(cmd, parameters, True))
+            latency = time.time() - start
+            self._check_auth(response)
+            fields = {}
+            pairs = _iter_urlencoded(response, chunk_size)
+            while True:
+                try:
+                    key, value = pairs.next()
+                except StopIteration:
+                    break
+                except (socket.error, httplib.HTTPException), e:
+                    raise _http_error(e)
+                if key == 'list[]':
+                    yield value
+                else:
+                    fields.setdefault(key, []).append(value)
+            failed = False
+        except (DeadlineExceeded, GeneratorExit):
+            # Given up by the client or the caller
+            failed = None
+            raise
+        except ApiHttpError:
+            raise
+        except ApiError:
+            failed = False
+            raise
+        finally:
+            if response is not None and hasattr(response, 'close'):
+                response.close()
+            if self._limiter is not None:
+                if latency is None:
+                    latency = time.time() - start
+                self._limiter.release(latency, failed)
+        if 'error' in fields and fields['error'][0] != "0":
+            self._raise_error(fields)
+
+    def _open (self, cmd, parameters=None, stream=False):
+        """Open
+
+        Sends a command to the server and returns
+        the response object
+
+        Parameters:
+        cmd = command name
+        parameters = list of tuples with parameters (default: None)
+        stream = if True, the transport does not read the
+                 body in advance (default: False)
+        """
+        command = COMMANDS.get(cmd)
+        timeout = self._get_timeout(command, parameters)
+
+        # Ask for JSON, unless the body is going to be streamed
+        json_mode = self._use_json and not stream
+        if command is not None:
+            if json_mode:
+                path = command.json_path
+            else:
+                path = command.path
+        elif json_mode:
+            path = "/%s?json=yes" % cmd
+        else:
+            path = "/%s" % cmd
+
+        if parameters is not None:
+            parameters = encode(parameters)
+            method = "POST"
+            headers = self._post_headers
+        else:
+            method = "GET"
+            headers = self._headers
+
+        try:
+            response = self._transport.open(method, path, parameters, \
+                                            headers, stream, timeout)
+        except urllib2.URLError, e:
+            raise _http_error(e.reason)
+        except (socket.error, httplib.HTTPException), e:
+            raise _http_error(e)
+        if response.status >= 400:
+            response.close()
+            raise ApiHttpError("HTTP Error: %s" % response.reason, \
+                               response.status)
+        return response
+
+    def _get_timeout (self, command, parameters):
+        """Returns the timeout of a Command (None if it is
+           unknown), shortened to the time left of the
+           current deadline"""
+        if command is not None and command.is_read_only(parameters):
+            timeout = self._timeout
         else:
-            protocol = "http"
-        return '%s://%s:%d/%s' % \
-               (protocol, \
-                self._hostname, \
-                self._port, \
-                cmd)
+            timeout = self._write_timeout
+        deadline = current_deadline()
+        if deadline is not None:
+            remaining = deadline.remaining()
+            # A zero timeout would make the socket non-blocking
+            if remaining <= 0:
+                raise DeadlineExceeded("Deadline exceeded")
+            if timeout is None or remaining < timeout:
+                timeout = remaining
+        return timeout
+
+    def pool_stats (self):
+        """Pool stats
+
+        Returns a dictionary with the hits, misses, evictions
+        and reconnects counters of the connection pool (or the
+        counters of the transport), or None if pooling is disabled
+        """
+        return self._transport.stats()
+
+    def limiter_stats (self):
+        """Limiter stats
+
+        Returns a dictionary with the state of the rate
+        limiter, or None if there is no limiter
+        """
+        if self._limiter is None:
+            return None
+        return self._limiter.stats()
+
+    def metrics (self):
+        """Metrics
+
+        Returns a dictionary with the metrics of every
+        command, or None if metrics are disabled
+        """
+        if self._metrics is None:
+            return None
+        return self._metrics.as_dict()
+
+    def close (self):
+        """Closes the idle pooled connections"""
+        self._transport.close()
+
+    def _get_auth_header (self):
+        """Returns the value for the Authorization header"""
+        return 'Basic %s' % base64.b64encode("%s:%s" % \
+                                             (self._username, \
+                                              self._password))
 
     def _handle_response (self, response):
         """Handle response
@@ -510,14 +984,20 @@ class ApiConnector (object):
 
         Raises ApiError on errors
         """
-        # Get response headers to check if there
-        # was any problem with login
-        info = response.info()
-        if info.getheader('X-DirectAdmin') == 'unauthorized':
-            raise ApiError("Invalid username or password")
-
-        # Parse the response query string
-        response =  urlparse.parse_qs(response.read())
+        self._check_auth(response)
+
+        try:
+            body = response.read()
+        except (socket.error, httplib.HTTPException), e:
+            raise _http_error(e)
+        if self._use_json and body.lstrip()[:1] in ('{', '['):
+            response = _from_json(json.loads(body))
+            # JSON lists are the equivalent of 'list[]'
+            if isinstance(response, list):
+                return response
+        else:
+            # Parse the response query string
+            response =  urlparse.parse_qs(body)
 
         # Check for 'error' flag
         if 'error' in response:
@@ -526,12 +1006,7 @@ class ApiConnector (object):
                 return True
             # If not, check for details of the error
             else:
-                if 'details' in response:
-                    raise ApiError(response['details'][0])
-                if 'text' in response:
-                    raise ApiError(response['text'][0])
-                else:
-                    raise ApiError("Uknown error detected")
+                self._raise_error(response)
         # If we got a 'list[]' keyword, we return only the list
         elif 'list[]' in response:
             return response['list[]']
@@ -539,19 +1014,240 @@ class ApiConnector (object):
         else:
             return response
 
+    def _check_auth (self, response):
+        """Checks the response headers to see if
+           there was any problem with login"""
+        info = response.info()
+        if info.getheader('X-DirectAdmin') == 'unauthorized':
+            raise ApiAuthError("Invalid username or password")
+
+    def _raise_error (self, response):
+        """Raises an ApiError with the details
+           of an error response"""
+        if 'details' in response:
+            raise ApiError(response['details'][0])
+        if 'text' in response:
+            raise ApiError(response['text'][0])
+        else:
+            raise ApiError("Uknown error detected")
+
+def _check_deadline ():
+    """Raises DeadlineExceeded if the current deadline expired"""
+    deadline = current_deadline()
+    if deadline is not None and deadline.expired():
+        raise DeadlineExceeded("Deadline exceeded")
+
+def _http_error (reason):
+    """Returns the exception for a network failure: DeadlineExceeded
+       if it happened because the current deadline expired"""
+    deadline = current_deadline()
+    if deadline is not None and deadline.expired():
+        return DeadlineExceeded("Deadline exceeded: %s" % reason)
+    return ApiHttpError("HTTP Error: %s" % reason, network=True)
+
+class _CountingResponse (object):
+    """Wraps a response to count the bytes read from it"""
+    def __init__ (self, response, received):
+        self._response = response
+        self._received = received
+
+    def info (self):
+        return self._response.info()
+
+    def close (self):
+        if hasattr(self._response, 'close'):
+            self._response.close()
+
+    def read (self, amt=None):
+        if amt is None:
+            data = self._response.read()
+        else:
+            data = self._response.read(amt)
+        self._received[0] += len(data)
+        return data
+
+class _DecodingResponse (object):
+    """Wraps a gzip or deflate encoded response to decompress
+       its body as it is read. If received is given, the bytes
+       decoded are added to its second item"""
+    def __init__ (self, response, encoding, received=None):
+        self._response = response
+        self._encoding = encoding
+        if encoding == 'gzip':
+            self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        else:
+            self._decompressor = zlib.decompressobj()
+        self._started = False
+        self._finished = False
+        self._buffer = ''
+        self._received = received
+        if received is not None:
+            received[1] = 0
+
+    def info (self):
+        return self._response.info()
+
+    def close (self):
+        if hasattr(self._response, 'close'):
+            self._response.close()
+
+    def _decompress (self, data):
+        """Decompresses a chunk of the body"""
+        try:
+            if not self._started and data and self._encoding == 'deflate':
+                self._started = True
+                try:
+                    return self._decompressor.decompress(data)
+                except zlib.error:
+                    # Some servers send raw deflate data, without
+                    # the zlib header the standard asks for
+                    self._decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+            return self._decompressor.decompress(data)
+        except zlib.error, e:
+            raise ApiHttpError("HTTP Error: invalid %s body: %s" % \
+                               (self._encoding, e))
+
+    def _flush (self):
+        """Returns the data left in the decompressor"""
+        self._finished = True
+        try:
+            return self._decompressor.flush()
+        except zlib.error, e:
+            raise ApiHttpError("HTTP Error: invalid %s body: %s" % \
+                               (self._encoding, e))
+
+    def read (self, amt=None):
+        if amt is None:
+            data = self._buffer
+            if not self._finished:
+                data += self._decompress(self._response.read()) + \
+                        self._flush()
+            self._buffer = ''
+        else:
+            # Read compressed chunks until amt bytes are decoded
+            while len(self._buffer) < amt and not self._finished:
+                chunk = self._response.read(amt)
+                if chunk:
+                    self._buffer += self._decompress(chunk)
+                else:
+                    self._buffer += self._flush()
+            data = self._buffer[:amt]
+            self._buffer = self._buffer[amt:]
+        if self._received is not None:
+            self._received[1] += len(data)
+        return data
+
+def _decode (response, received=None):
+    """Returns a response whose body is read decompressed,
+       counting the bytes read in received if it is given"""
+    if received is not None:
+        response = _CountingResponse(response, received)
+    encoding = response.info().getheader('Content-Encoding')
+    if encoding is None:
+        return response
+    encoding = encoding.strip().lower()
+    if encoding in ('gzip', 'x-gzip'):
+        return _DecodingResponse(response, 'gzip', received)
+    if encoding == 'deflate':
+        return _DecodingResponse(response, 'deflate', received)
+    if encoding in ('', 'identity'):
+        return response
+    if hasattr(response, 'close'):
+        response.close()
+    raise ApiHttpError("HTTP Error: unsupported content encoding %s" % \
+                       encoding)
+
+def _to_str (value):
+    """Converts a decoded JSON scalar to a string"""
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return value and "1" or "0"
+    return str(value)
+
+def _from_json (data):
+    """From JSON
+
+    Converts a decoded JSON response to the same structure
+    parse_qs would have returned for the url-encoded one:
+    a list of strings, or a dictionary of lists
+    """
+    if isinstance(data, list):
+        return [_to_str(item) for item in data]
+    response = {}
+    for key, value in data.items():
+        if isinstance(value, list):
+            response[_to_str(key)] = [_to_str(item) for item in value]
+        elif isinstance(value, dict):
+            response[_to_str(key)] = [dict((_to_str(k), _to_str(v)) \
+                                           for k, v in value.items())]
+        else:
+            response[_to_str(key)] = [_to_str(value)]
+    # JSON errors carry their details under 'result'
+    if 'result' in response and 'details' not in response:
+        response['details'] = response['result']
+    return response
+
+def _iter_urlencoded (response, chunk_size=65536):
+    """Iter urlencoded
+
+    Decodes an url-encoded body incrementally, yielding
+    (key, value) tuples as they are read from the response.
+    As parse_qs does, pairs with blank values are skipped.
+    """
+    pending = ''
+    while True:
+        data = response.read(chunk_size)
+        if not data:
+            break
+        pairs = (pending + data).split('&')
+        pending = pairs.pop()
+        for pair in pairs:
+            key, sep, value = pair.partition('=')
+            if value:
+                yield urllib.unquote_plus(key), urllib.unquote_plus(value)
+    key, sep, value = pending.partition('=')
+    if value:
+        yield urllib.unquote_plus(key), urllib.unquote_plus(value)
+
 class Api (object):
     """API
 
     Directadmin API implementation
+
+    Api objects are safe to share between threads. Without
+    pooling every command opens its own connection; with
+    pool_size the threads share a pool of keep-alive
+    connections, and a ThreadLocalTransport gives every
+    thread a keep-alive connection of its own. The User
+    objects passed to the create methods are not modified.
     """
     _connector = None
+    _cache = None
+    _cache_scope = None
+    _retry = None
+    _single_flight = None
 
     def __init__ (self, \
                   username, \
                   password, \
                   hostname="localhost", \
                   port=2222, \
-                  https=False):
+                  https=False, \
+                  pool_size=0, \
+                  pool_idle_timeout=60, \
+                  cache=None, \
+                  use_json=False, \
+                  rate_limiter=None, \
+                  retry=None, \
+                  metrics=None, \
+                  transport=None, \
+                  coalesce=False, \
+                  timeout=None, \
+                  write_timeout=None, \
+                  compression=True):
         """Constructor
 
         Initializes the connection for the API
@@ -563,19 +1259,241 @@ class Api (object):
         port -- Directadmin server port (default: 2222)
         https -- boolean, if True all transactions will
                  be performed using HTTPS (default: False)
+        pool_size -- maximum number of idle keep-alive connections
+                     kept open, zero disables pooling (default: 0)
+        pool_idle_timeout -- seconds after which an idle pooled
+                             connection is closed (default: 60)
+        cache -- ResponseCache object used to cache the responses
+                 of read-only commands (default: None)
+        use_json -- boolean, if True responses are requested in JSON
+                    format, falling back to the url-encoded format
+                    for servers that do not support it (default: False)
+        rate_limiter -- TokenBucket or AdaptiveLimiter object used to
+                        throttle the requests sent (default: None)
+        retry -- RetryPolicy object describing how commands are
+                 retried after transient failures (default: None)
+        metrics -- Metrics object where the latency, size and errors
+                   of every command sent are recorded (default: None)
+        transport -- transport object the requests are sent through,
+                     e.g. a ReplayTransport (default: None, chosen
+                     according to pool_size)
+        coalesce -- boolean, if True concurrent identical read-only
+                    commands share a single request (default: False)
+        timeout -- seconds a request may block on the network
+                   (default: None, the default socket timeout)
+        write_timeout -- timeout of the commands that modify the
+                         server (default: None, same as timeout)
+        compression -- boolean, if True gzip and deflate encoded
+                       responses are accepted (default: True)
         """
+        self._cache = cache
+        # Cached responses are only shared by Api objects
+        # talking to the same server as the same user
+        self._cache_scope = (hostname, int(port), username)
+        self._retry = retry
+        if coalesce:
+            self._single_flight = SingleFlight()
         self._connector = ApiConnector(username, \
                                        password, \
                                        hostname, \
                                        port, \
-                                       https)
+                                       https, \
+                                       pool_size, \
+                                       pool_idle_timeout, \
+                                       use_json, \
+                                       rate_limiter, \
+                                       metrics, \
+                                       transport, \
+                                       timeout, \
+                                       write_timeout, \
+                                       compression)
 
     def _execute_cmd (self, cmd, parameters=None):
        """Execute command
 
        Executes a command using the Connection object
        """
-       return self._connector.execute(cmd, parameters)
+       if self._cache is None and self._single_flight is None:
+           return self._send_cmd(cmd, parameters)
+
+       if is_read_only(cmd, parameters):
+           if self._cache is None or self._cache.ttl(cmd) <= 0:
+               return self._read_cmd(cmd, parameters)
+           found, value = self._cache.get(cmd, parameters, \
+                                          self._cache_scope)
+           if not found:
+               # Not stored if a change is made while it is read
+               generation = self._cache.generation()
+               value = self._read_cmd(cmd, parameters)
+               self._cache.put(cmd, parameters, value, \
+                               self._cache_scope, generation)
+           return value
+
+       try:
+           return self._send_cmd(cmd, parameters)
+       finally:
+           if self._cache is not None:
+               self._cache.invalidate_for(cmd, parameters, \
+                                          self._cache_scope)
+           if self._single_flight is not None:
+               self._single_flight.forget()
+
+    def _read_cmd (self, cmd, parameters=None):
+        """Sends a read-only command, sharing the request with
+           identical commands in flight if coalescing is enabled"""
+        if self._single_flight is None:
+            return self._send_cmd(cmd, parameters)
+        # Waiting for another caller is bounded by the deadline too
+        timeout = None
+        deadline = current_deadline()
+        if deadline is not None:
+            timeout = deadline.remaining()
+        try:
+            return self._single_flight.do(cmd, parameters, \
+                                          self._send_cmd, timeout)
+        except TimeoutError:
+            raise DeadlineExceeded("Deadline exceeded waiting for " \
+                                   "the same command in flight")
+
+    def _send_cmd (self, cmd, parameters=None):
+        """Send command
+
+        Sends a command using the Connection object, retrying
+        transient failures as described by the retry policy
+        """
+        if self._retry is None:
+            return self._connector.execute(cmd, parameters)
+
+        read_only = is_read_only(cmd, parameters)
+        verifier = None
+        if not read_only:
+            verifier = self._retry.get_verifier(cmd)
+
+        attempt = 1
+        while True:
+            try:
+                return self._connector.execute(cmd, parameters)
+            except ApiHttpError, e:
+                if attempt >= self._retry.attempts or \
+                   not self._retry.is_transient(e) or \
+                   (not read_only and verifier is None):
+                    raise
+                exc_info = sys.exc_info()
+            delay = self._retry.delay(attempt - 1)
+            # Do not wait for a retry that could not be sent in time
+            deadline = current_deadline()
+            if deadline is not None and deadline.remaining() <= delay:
+                raise exc_info[0], exc_info[1], exc_info[2]
+            time.sleep(delay)
+
+            # Mutating commands may have been applied even if
+            # the response was lost, check before sending it again
+            if verifier is not None:
+                if self._cache is not None:
+                    self._cache.invalidate_for(cmd, parameters, \
+                                               self._cache_scope)
+                try:
+                    if verifier(self, cmd, parameters):
+                        return True
+                except ApiError:
+                    raise exc_info[0], exc_info[1], exc_info[2]
+            attempt += 1
+
+    def cache_stats (self):
+        """Cache stats
+
+        Returns a dictionary with the hits, misses, evictions
+        and invalidations counters of the response cache,
+        or None if caching is disabled
+        """
+        if self._cache is None:
+            return None
+        return self._cache.stats()
+
+    def coalesce_stats (self):
+        """Coalesce stats
+
+        Returns a dictionary with the number of read-only
+        requests sent and of callers that shared a response,
+        or None if coalescing is disabled
+        """
+        if self._single_flight is None:
+            return None
+        return self._single_flight.stats()
+
+    def pool_stats (self):
+        """Pool stats
+
+        Returns a dictionary with the connection pool counters,
+        or None if pooling is disabled
+        """
+        return self._connector.pool_stats()
+
+    def limiter_stats (self):
+        """Limiter stats
+
+        Returns a dictionary with the state of the rate
+        limiter, or None if there is no limiter
+        """
+        return self._connector.limiter_stats()
+
+    def metrics (self):
+        """Metrics
+
+        Returns a dictionary of command name -> dictionary with
+        its calls, latency histogram, bytes sent and received
+        and errors by type, or None if metrics are disabled
+        """
+        return self._connector.metrics()
+
+    def add_pre_request_hook (self, hook):
+        """Add pre request hook
+
+        Registers a function(cmd, parameters) called
+        before every command is sent to the server
+        """
+        self._connector.add_pre_request_hook(hook)
+
+    def add_post_request_hook (self, hook):
+        """Add post request hook
+
+        Registers a function(cmd, parameters, result, error, latency)
+        called after every command sent to the server
+        """
+        self._connector.add_post_request_hook(hook)
+
+    def close (self):
+        """Closes the idle pooled connections"""
+        self._connector.close()
+
+    def call (self, cmd, parameters=None):
+        """Call
+
+        Sends any command of the commands table, for those
+        without a method of their own. The parameters are
+        checked against the table before sending them, and
+        empty listings are returned as empty lists.
+
+        Parameters:
+        cmd -- command name
+        parameters -- list of (name, value) tuples or dictionary
+                      (default: None)
+
+        Raises ValueError if the command is unknown or the
+        parameters do not match its description
+        """
+        command = COMMANDS.get(cmd)
+        if command is None:
+            raise ValueError("unknown command: %s" % cmd)
+        if isinstance(parameters, dict):
+            parameters = parameters.items()
+        command.check(parameters)
+        response = self._execute_cmd(cmd, parameters or None)
+        # Servers answer an empty body when there is nothing to list
+        if command.shape == 'list' and response == {} and \
+           command.is_read_only(parameters):
+            return []
+        return response
 
     def _yes_no (self, b):
         """Translates a boolean to "yes"/"no" """
@@ -722,6 +1640,122 @@ class Api (object):
         # Do the magic
         return self._execute_cmd("CMD_API_SELECT_USERS", parameters)
 
+    def _handle_bulk_suspensions (self, users, suspend, \
+                                  chunk_size, workers, retries, \
+                                  deadline=None):
+        """Handle bulk suspensions
+
+        Internal method to suspend/unsuspend a large list of
+        users splitting it in chunks which are sent in parallel.
+
+        A chunk that fails is sent again, split in two halves,
+        up to `retries` times, so only failed chunks are retried
+        and a single bad username ends up isolated from the rest.
+
+        Once the deadline (default: the current one) expires, the
+        chunks not sent yet fail with DeadlineExceeded at once
+        and are not retried.
+
+        Returns a BulkResult
+        """
+        if deadline is None:
+            deadline = current_deadline()
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be greater than zero")
+        usernames = []
+        for user in users:
+            if isinstance(user, User):
+                usernames.append(user['username'])
+            else:
+                usernames.append(user)
+        chunks = [usernames[n:n + chunk_size] \
+                  for n in range(0, len(usernames), chunk_size)]
+
+        result = BulkResult()
+        pool = WorkerPool(workers)
+        try:
+            attempt = 0
+            while chunks:
+                futures = {}
+                send = self._handle_suspensions
+                if deadline is not None:
+                    send = deadline.wrap(send)
+                for chunk in chunks:
+                    future = pool.submit(send, chunk, suspend)
+                    futures[future] = chunk
+                chunks = []
+                for future in as_completed(futures.keys()):
+                    chunk = futures[future]
+                    try:
+                        future.result()
+                    except DeadlineExceeded, e:
+                        for username in chunk:
+                            result.failed[username] = e
+                    except ApiError, e:
+                        if attempt < retries:
+                            half = (len(chunk) + 1) // 2
+                            chunks.append(chunk[:half])
+                            if chunk[half:]:
+                                chunks.append(chunk[half:])
+                        else:
+                            for username in chunk:
+                                result.failed[username] = e
+                    else:
+                        result.succeeded.extend(chunk)
+                attempt += 1
+        finally:
+            pool.shutdown()
+        return result
+
+    def bulk_suspend_accounts (self, users, chunk_size=100, \
+                               workers=4, retries=2, deadline=None):
+        """Bulk suspend accounts
+
+        Implements command CMD_API_SELECT_USERS
+
+        Suspends a large list of accounts of *ANY* type,
+        sending them in chunks of chunk_size users through
+        up to `workers` parallel requests.
+
+        Returns a BulkResult with the users that were suspended
+        and the ones that failed. The failed ones can be passed
+        again to resume the operation.
+
+        Parameters:
+        users -- list of names or User objects of the
+                 Admins/Resellers/Users to suspend
+        chunk_size -- number of users per request (default: 100)
+        workers -- number of requests sent at once (default: 4)
+        retries -- number of times a failed chunk is retried (default: 2)
+        deadline -- Deadline after which the users not done yet
+                    fail with DeadlineExceeded (default: None, the
+                    deadline of the caller if there is one)
+        """
+        return self._handle_bulk_suspensions(users, True, chunk_size, \
+                                             workers, retries, deadline)
+
+    def bulk_unsuspend_accounts (self, users, chunk_size=100, \
+                                 workers=4, retries=2, deadline=None):
+        """Bulk unsuspend accounts
+
+        Implements command CMD_API_SELECT_USERS
+
+        Unsuspends a large list of accounts of *ANY* type.
+        Works like bulk_suspend_accounts.
+
+        Parameters:
+        users -- list of names or User objects of the
+                 Admins/Resellers/Users to unsuspend
+        chunk_size -- number of users per request (default: 100)
+        workers -- number of requests sent at once (default: 4)
+        retries -- number of times a failed chunk is retried (default: 2)
+        deadline -- Deadline after which the users not done yet
+                    fail with DeadlineExceeded (default: None, the
+                    deadline of the caller if there is one)
+        """
+        return self._handle_bulk_suspensions(users, False, chunk_size, \
+                                             workers, retries, deadline)
+
     def suspend_account (self, user):
         """Suspend account
 
@@ -803,6 +1837,17 @@ class Api (object):
         """
         return self._execute_cmd("CMD_API_SHOW_ALL_USERS")
 
+    def stream_all_users (self):
+        """Stream All Users
+
+        Implements command CMD_API_SHOW_ALL_USERS
+
+        Same as list_all_users, but returns a generator that
+        yields the usernames as they are read from the server,
+        keeping memory usage bounded on very large servers
+        """
+        return self._connector.execute_stream("CMD_API_SHOW_ALL_USERS")
+
     def list_users (self, reseller=None):
         """List Users
 
@@ -819,6 +1864,98 @@ class Api (object):
 
         return self._execute_cmd("CMD_API_SHOW_USERS", parameters)
 
+    def stream_users (self, reseller=None):
+        """Stream Users
+
+        Implements command CMD_API_SHOW_USERS
+
+        Same as list_users, but returns a generator that
+        yields the usernames as they are read from the server
+        """
+        parameters = None
+        if reseller is not None:
+            parameters = [('reseller', reseller)]
+
+        return self._connector.execute_stream("CMD_API_SHOW_USERS", \
+                                              parameters)
+
+    def iter_users (self, reseller=None, prefetch=0, \
+                    details=('usage', 'limits', 'domains'), typed=False, \
+                    deadline=None):
+        """Iterate users
+
+        Returns a generator of UserHandle objects for all the users
+        (or the users of a reseller, as list_users does). The usage,
+        limits and domains of every user are fetched when they are
+        first accessed.
+
+        With prefetch, the details of the next users are fetched
+        in the background while the current one is processed, so
+        a sequential loop runs at near-parallel speed.
+
+        Parameters:
+        reseller -- if given, only the users of this reseller
+                    (default: None, all the users)
+        prefetch -- number of users whose details are fetched
+                    ahead, zero disables prefetching (default: 0)
+        details -- details prefetched (default: usage, limits, domains)
+        typed -- boolean, if True usage and limits are UserUsage
+                 and UserLimits records (default: False)
+        deadline -- Deadline for the whole crawl: once it expires
+                    no more users are yielded, and the details not
+                    fetched yet raise DeadlineExceeded (default: None,
+                    the deadline of the caller if there is one)
+        """
+        if deadline is None:
+            deadline = current_deadline()
+        if deadline is not None:
+            deadline.__enter__()
+            try:
+                names = self._list_names(reseller)
+            finally:
+                deadline.__exit__(None, None, None)
+        else:
+            names = self._list_names(reseller)
+        handles = [UserHandle(self, name, typed, deadline) for name in names]
+        if prefetch <= 0:
+            for handle in handles:
+                if deadline is not None and deadline.expired():
+                    return
+                yield handle
+            return
+
+        pool = WorkerPool(prefetch)
+        pending = []
+        try:
+            for handle in handles[:prefetch]:
+                pending.extend(handle.prefetch(pool, details))
+            for n, handle in enumerate(handles):
+                if n + prefetch < len(handles):
+                    pending = [future for future in pending \
+                               if not future.done()]
+                    pending.extend(handles[n + prefetch].prefetch(pool, \
+                                                                  details))
+                handles[n] = None
+                if deadline is not None and deadline.expired():
+                    return
+                yield handle
+        finally:
+            # Stopped early: drop the details nobody is going to read
+            for future in pending:
+                future.cancel()
+            pool.shutdown(False)
+
+    def _list_names (self, reseller=None):
+        """Returns the names of all the users, or of the
+           users of a reseller, as a list"""
+        if reseller is None:
+            names = self.list_all_users()
+        else:
+            names = self.list_users(reseller)
+        if not isinstance(names, list):
+            return []
+        return names
+
     def list_resellers (self):
         """List Resellers
 
@@ -841,7 +1978,7 @@ class Api (object):
         """
         return self._execute_cmd("CMD_API_SHOW_ADMINS")
 
-    def get_server_stats (self):
+    def get_server_stats (self, typed=False):
         """Get Server Statistics
 
         Implements command CMD_API_ADMIN_STATS
@@ -856,10 +1993,15 @@ class Api (object):
         - 'usedpercent'
         - 'mounted'
 
+        If typed is True, a ServerStats record with the values
+        already parsed is returned instead.
+
         Method info: http://www.directadmin.com/api.html#info
         """
         # Execute command
         stats = self._execute_cmd("CMD_API_ADMIN_STATS")
+        if typed:
+            return ServerStats.from_response(stats)
         
         # Split disk info
         options = ['filesystem', \
@@ -869,37 +2011,47 @@ class Api (object):
                    'usedpercent', \
                    'mounted']
         for key in stats.keys():
-            if key.startswith('disk'):
+            # JSON responses already have the disk info split
+            if key.startswith('disk') and \
+               not isinstance(stats[key][0], dict):
                 items = stats[key][0].split(':')
                 stats[key][0] = {}
                 for option in options:
                     stats[key][0][option] = items.pop(0)
         return stats
 
-    def get_user_usage (self, user):
+    def get_user_usage (self, user, typed=False):
         """Get User Usage
 
         Implements command CMD_API_SHOW_USER_USAGE
 
-        Returns a dictionary with the usage information for a user
+        Returns a dictionary with the usage information for a user,
+        or a UserUsage record if typed is True
 
         Method info: http://www.directadmin.com/api.html#info
         """
-        return self._execute_cmd("CMD_API_SHOW_USER_USAGE", \
-                                 [('user', user)])
+        usage = self._execute_cmd("CMD_API_SHOW_USER_USAGE", \
+                                  [('user', user)])
+        if typed:
+            return UserUsage.from_response(usage)
+        return usage
 
-    def get_user_limits (self, user):
+    def get_user_limits (self, user, typed=False):
         """Get User Limits
 
         Implements command CMD_API_SHOW_USER_CONFIG
 
         Returns a dictionary with the user's upper limits
-        and settings that defines their account
+        and settings that defines their account,
+        or a UserLimits record if typed is True
 
         Method info: http://www.directadmin.com/api.html#info
         """
-        return self._execute_cmd("CMD_API_SHOW_USER_CONFIG", \
-                                 [('user', user)])
+        limits = self._execute_cmd("CMD_API_SHOW_USER_CONFIG", \
+                                   [('user', user)])
+        if typed:
+            return UserLimits.from_response(limits)
+        return limits
 
     def get_user_domains (self, user):
         """Get User Domains
@@ -970,6 +2122,16 @@ class Api (object):
         """
         return self._execute_cmd("CMD_API_SHOW_DOMAINS")
 
+    def stream_domains (self):
+        """Stream domains
+
+        Implements command CMD_API_SHOW_DOMAINS
+
+        Same as list_domains, but returns a generator that
+        yields the domains as they are read from the server
+        """
+        return self._connector.execute_stream("CMD_API_SHOW_DOMAINS")
+
     def list_subdomains (self, domain):
         """List subdomains
 
@@ -1117,6 +2279,21 @@ class Api (object):
                       ('domain', domain)]
         return self._execute_cmd("CMD_API_POP", parameters)
 
+    def stream_pop_accounts (self, domain):
+        """Stream POP accounts
+
+        Implements command CMD_API_POP
+
+        Same as list_pop_accounts, but returns a generator that
+        yields the accounts as they are read from the server
+
+        Parameters:
+        domain -- domain name of which the accounts will be listed
+        """
+        parameters = [('action', 'list'), \
+                      ('domain', domain)]
+        return self._connector.execute_stream("CMD_API_POP", parameters)
+
     def create_pop_account (self, domain, user, password, quota=0):
         """Create POP account
 
@@ -1305,3 +2482,132 @@ class Api (object):
                       ('select0', user)]
         return self._execute_cmd("CMD_API_EMAIL_VACATION", parameters)
 
+class AsyncApi (object):
+    """Async API
+
+    Non-blocking version of the Directadmin API.
+
+    It offers the same methods as Api, with the same parameters,
+    but every call is run by a bounded pool of workers sharing
+    a pool of keep-alive connections, and returns immediately
+    a Future. Results (or ApiError exceptions) are obtained
+    with the result() method of the future.
+
+    Usage:
+
+    api = AsyncApi("admin", "password", "hostname.com", concurrency=20)
+    futures = [api.get_user_usage(user) for user in users]
+    for future in as_completed(futures):
+        print future.result()
+    api.close()
+    """
+    _api = None
+    _workers = None
+
+    def __init__ (self, \
+                  username, \
+                  password, \
+                  hostname="localhost", \
+                  port=2222, \
+                  https=False, \
+                  concurrency=10, \
+                  **options):
+        """Constructor
+
+        Parameters:
+        username -- Directadmin username
+        password -- Directadmin password
+        hostname -- Directadmin server host (default: localhost)
+        port -- Directadmin server port (default: 2222)
+        https -- boolean, if True all transactions will
+                 be performed using HTTPS (default: False)
+        concurrency -- maximum number of requests in flight (default: 10)
+
+        Any other keyword argument is passed to the Api
+        constructor. pool_size defaults to concurrency.
+        """
+        options.setdefault('pool_size', concurrency)
+        self._api = Api(username, \
+                        password, \
+                        hostname, \
+                        port, \
+                        https, \
+                        **options)
+        self._workers = WorkerPool(concurrency)
+
+    def pool_stats (self):
+        """Pool stats
+
+        Returns a dictionary with the connection pool counters
+        """
+        return self._api.pool_stats()
+
+    def cache_stats (self):
+        """Cache stats
+
+        Returns a dictionary with the response cache counters
+        """
+        return self._api.cache_stats()
+
+    def limiter_stats (self):
+        """Limiter stats
+
+        Returns a dictionary with the state of the rate limiter
+        """
+        return self._api.limiter_stats()
+
+    def coalesce_stats (self):
+        """Coalesce stats
+
+        Returns a dictionary with the request coalescing counters
+        """
+        return self._api.coalesce_stats()
+
+    def metrics (self):
+        """Metrics
+
+        Returns a dictionary with the metrics of every command
+        """
+        return self._api.metrics()
+
+    def add_pre_request_hook (self, hook):
+        """Registers a function(cmd, parameters) called
+           before every command, from the worker threads"""
+        self._api.add_pre_request_hook(hook)
+
+    def add_post_request_hook (self, hook):
+        """Registers a function(cmd, parameters, result, error, latency)
+           called after every command, from the worker threads"""
+        self._api.add_post_request_hook(hook)
+
+    def close (self):
+        """Close
+
+        Waits for the pending calls and closes the connections
+        """
+        self._workers.shutdown()
+        self._api.close()
+
+def _async_method (name):
+    """Builds an AsyncApi method which runs
+       the Api method with the same name in the workers"""
+    method = getattr(Api, name)
+    def submit (self, *args, **kwargs):
+        fn = getattr(self._api, name)
+        # The call runs under the deadline of the caller, if any
+        deadline = current_deadline()
+        if deadline is not None:
+            fn = deadline.wrap(fn)
+        return self._workers.submit(fn, *args, **kwargs)
+    submit.__name__ = name
+    submit.__doc__ = "%s\n\n        Returns a Future" % method.__doc__
+    return submit
+
+for _name in dir(Api):
+    # Streams and iterators are consumed by the caller,
+    # so they are not mirrored
+    if not _name.startswith('_') and not _name.startswith('stream_') and \
+       not _name.startswith('iter_') and \
+       not hasattr(AsyncApi, _name):
+        setattr(AsyncApi, _name, _async_method(_name))
+del _name
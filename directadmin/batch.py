@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+"""Batching of individual suspensions and unsuspensions
+
+This file is part of python-directadmin.
+
+python-directadmin is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+python-directadmin is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with python-directadmin.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import sys
+import math
+import time
+import threading
+
+from api import User
+from futures import Future
+
+class SuspensionBatcher (object):
+    """Suspension Batcher
+
+    Buffers suspend and unsuspend requests for up to `window`
+    seconds, or until `max_batch` users are waiting, and sends
+    them as a single CMD_API_SELECT_USERS command per direction.
+    Every request returns a Future for the outcome of its user:
+    True, or the ApiError raised for it. A batch that fails is
+    split in halves and retried (see bulk_suspend_accounts),
+    so one bad username does not fail the rest.
+
+    If a user is suspended and unsuspended within the same
+    window, only the last request is sent and both futures
+    get its outcome.
+
+    Instances are safe to share between threads.
+
+    Usage:
+
+    batcher = SuspensionBatcher(api, window=0.5, max_batch=100)
+    future = batcher.suspend("baduser")
+    ...
+    print future.result()
+    batcher.close()
+    """
+    def __init__ (self, api, window=0.5, max_batch=100, retries=None):
+        """Constructor
+
+        Parameters:
+        api -- Api object
+        window -- seconds a request may wait for others (default: 0.5)
+        max_batch -- maximum number of users per command (default: 100)
+        retries -- number of times a failed batch is split and
+                   retried (default: enough to isolate every user)
+        """
+        if max_batch < 1:
+            raise ValueError("max_batch must be greater than zero")
+        if retries is None:
+            retries = int(math.ceil(math.log(max_batch, 2)))
+        self._api = api
+        self._window = window
+        self._max_batch = int(max_batch)
+        self._retries = retries
+        # suspend flag -> {username: [futures]}, and arrival order
+        self._pending = {True: {}, False: {}}
+        self._order = {True: [], False: []}
+        self._first = {True: None, False: None}
+        self._condition = threading.Condition()
+        self._closed = False
+        self._thread = None
+        self.requests = 0
+        self.batches = 0
+
+    def suspend (self, user):
+        """Queues the suspension of a user (name or User object)
+           and returns a Future"""
+        return self._add(user, True)
+
+    def unsuspend (self, user):
+        """Queues the unsuspension of a user (name or User object)
+           and returns a Future"""
+        return self._add(user, False)
+
+    def _add (self, user, suspend):
+        """Queues a request"""
+        if isinstance(user, User):
+            user = user['username']
+        future = Future()
+        self._condition.acquire()
+        try:
+            if self._closed:
+                raise RuntimeError("cannot queue requests after close")
+            self.requests += 1
+            futures = [future]
+            # The last request for a user wins
+            opposite = self._pending[not suspend].pop(user, None)
+            if opposite is not None:
+                self._order[not suspend].remove(user)
+                if not self._order[not suspend]:
+                    # Nothing left waiting in that direction
+                    self._first[not suspend] = None
+                futures.extend(opposite)
+            pending = self._pending[suspend]
+            if user in pending:
+                pending[user].extend(futures)
+            else:
+                pending[user] = futures
+                self._order[suspend].append(user)
+            if self._first[suspend] is None:
+                self._first[suspend] = time.time()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run)
+                self._thread.setDaemon(True)
+                self._thread.start()
+            self._condition.notify()
+        finally:
+            self._condition.release()
+        return future
+
+    def _due (self, now):
+        """Returns the direction of a batch ready to be sent,
+           or None, and the seconds until the next one is due"""
+        wait = None
+        for suspend in (True, False):
+            if not self._order[suspend]:
+                continue
+            if self._closed or \
+               len(self._order[suspend]) >= self._max_batch or \
+               now - self._first[suspend] >= self._window:
+                return suspend, 0
+            left = self._first[suspend] + self._window - now
+            if wait is None or left < wait:
+                wait = left
+        return None, wait
+
+    def _take (self, suspend):
+        """Removes a batch from the queue"""
+        users = self._order[suspend][:self._max_batch]
+        self._order[suspend] = self._order[suspend][self._max_batch:]
+        batch = [(user, self._pending[suspend].pop(user)) for user in users]
+        if self._order[suspend]:
+            # What is left was already waiting, send it next
+            self._first[suspend] = time.time() - self._window
+        else:
+            self._first[suspend] = None
+        return batch
+
+    def _run (self):
+        """Sends the batches as they are due"""
+        while True:
+            self._condition.acquire()
+            try:
+                while True:
+                    suspend, wait = self._due(time.time())
+                    if suspend is not None:
+                        break
+                    if self._closed:
+                        return
+                    self._condition.wait(wait)
+                batch = self._take(suspend)
+                self.batches += 1
+            finally:
+                self._condition.release()
+            self._send(batch, suspend)
+
+    def _send (self, batch, suspend):
+        """Sends a batch and sets the futures of its users"""
+        users = [user for user, futures in batch]
+        if suspend:
+            send = self._api.bulk_suspend_accounts
+        else:
+            send = self._api.bulk_unsuspend_accounts
+        try:
+            result = send(users, chunk_size=self._max_batch, workers=1, \
+                          retries=self._retries)
+        except:
+            exc_info = sys.exc_info()
+            for user, futures in batch:
+                for future in futures:
+                    future.set_exception(exc_info)
+            return
+        for user, futures in batch:
+            for future in futures:
+                if user in result.failed:
+                    future.set_exception(result.failed[user])
+                else:
+                    future.set_result(True)
+
+    def flush (self):
+        """Sends the queued requests right away"""
+        self._condition.acquire()
+        try:
+            for suspend in (True, False):
+                if self._first[suspend] is not None:
+                    self._first[suspend] = time.time() - self._window
+            self._condition.notify()
+        finally:
+            self._condition.release()
+
+    def stats (self):
+        """Returns a dictionary with the number of requests
+           queued and of batches sent"""
+        self._condition.acquire()
+        try:
+            return {'requests': self.requests, \
+                    'batches': self.batches, \
+                    'pending': len(self._order[True]) + \
+                               len(self._order[False])}
+        finally:
+            self._condition.release()
+
+    def close (self):
+        """Sends the queued requests and stops the batcher,
+           waiting until they are done"""
+        self._condition.acquire()
+        try:
+            self._closed = True
+            thread = self._thread
+            self._condition.notify()
+        finally:
+            self._condition.release()
+        if thread is not None:
+            thread.join()
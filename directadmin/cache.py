@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+"""Response cache for read-only API commands
+
+This file is part of python-directadmin.
+
+python-directadmin is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+python-directadmin is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with python-directadmin.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import sys
+import copy
+import time
+import threading
+from collections import OrderedDict
+
+from futures import Future
+from commands import COMMANDS
+
+# Time to live, in seconds, of the commands cached by default
+DEFAULT_TTLS = dict((command.name, command.ttl) \
+                    for command in COMMANDS.values() if command.ttl)
+
+# Cached commands affected by each mutating command:
+# command -> list of (cached command, parameters that must match)
+INVALIDATIONS = dict((command.name, command.invalidates) \
+                     for command in COMMANDS.values() if command.invalidates)
+
+def _make_key (cmd, parameters):
+    """Builds the key of a command and its parameters"""
+    if not parameters:
+        return (cmd, ())
+    return (cmd, tuple(sorted((str(k), str(v)) for k, v in parameters)))
+
+class ResponseCache (object):
+    """Response Cache
+
+    LRU cache with per command time to live for the
+    responses of read-only commands.
+
+    Entries are keyed on a scope, the server and user an Api
+    is logged in as, plus the command and its parameters.
+    Commands without a TTL in `ttls` use `default_ttl`,
+    and a TTL of zero means the command is not cached.
+
+    Every invalidation increases a generation counter: a
+    response read before an invalidation is not stored if
+    put() gets the generation taken before sending it.
+
+    Instances are safe to share between threads and
+    between several Api objects.
+    """
+    def __init__ (self, max_entries=1024, ttls=None, default_ttl=0):
+        """Constructor
+
+        Parameters:
+        max_entries -- maximum number of cached responses (default: 1024)
+        ttls -- dictionary of command -> seconds (default: DEFAULT_TTLS)
+        default_ttl -- seconds for the other read-only commands,
+                       zero disables caching them (default: 0)
+        """
+        if ttls is None:
+            ttls = DEFAULT_TTLS
+        self._max_entries = int(max_entries)
+        self._ttls = dict(ttls)
+        self._default_ttl = default_ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _key (self, cmd, parameters, scope):
+        """Builds the key of an entry"""
+        return (scope,) + _make_key(cmd, parameters)
+
+    def ttl (self, cmd):
+        """Returns the time to live for a command"""
+        return self._ttls.get(cmd, self._default_ttl)
+
+    def generation (self):
+        """Returns the current generation, to be passed to
+           put() with the response of a command sent after it"""
+        return self._generation
+
+    def get (self, cmd, parameters=None, scope=None):
+        """Get
+
+        Returns a tuple (found, value) with a copy
+        of the cached response, if it has not expired
+        """
+        key = self._key(cmd, parameters, scope)
+        self._lock.acquire()
+        try:
+            entry = self._entries.pop(key, None)
+            if entry is None or entry[0] < time.time():
+                self.misses += 1
+                return False, None
+            self._entries[key] = entry
+            self.hits += 1
+        finally:
+            self._lock.release()
+        return True, copy.deepcopy(entry[1])
+
+    def put (self, cmd, parameters, value, scope=None, generation=None):
+        """Put
+
+        Stores a copy of a response, evicting the least
+        recently used ones if the cache is full. If the
+        generation is given and there were invalidations
+        since it was taken, the response may be outdated
+        and is not stored
+        """
+        ttl = self.ttl(cmd)
+        if ttl <= 0:
+            return
+        key = self._key(cmd, parameters, scope)
+        entry = (time.time() + ttl, copy.deepcopy(value))
+        self._lock.acquire()
+        try:
+            if generation is not None and generation != self._generation:
+                return
+            self._entries.pop(key, None)
+            self._entries[key] = entry
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(False)
+                self.evictions += 1
+        finally:
+            self._lock.release()
+
+    def invalidate (self, cmd, match=(), scope=None):
+        """Invalidate
+
+        Removes the entries of a command, in the given scope
+        or in every one if it is None. If match is given, only
+        the entries including all of those (key, value)
+        parameters are removed
+        """
+        match = set((str(k), str(v)) for k, v in match)
+        self._lock.acquire()
+        try:
+            self._generation += 1
+            for key in self._entries.keys():
+                if key[1] == cmd and match.issubset(key[2]) and \
+                   (scope is None or key[0] == scope):
+                    del self._entries[key]
+                    self.invalidations += 1
+        finally:
+            self._lock.release()
+
+    def invalidate_for (self, cmd, parameters=None, scope=None):
+        """Removes the entries affected by a mutating command"""
+        parameters = dict(parameters or ())
+        for cached, keys in INVALIDATIONS.get(cmd, ()):
+            match = [(key, parameters[key]) for key in keys \
+                     if key in parameters]
+            self.invalidate(cached, match, scope)
+
+    def clear (self):
+        """Removes all the entries"""
+        self._lock.acquire()
+        try:
+            self._generation += 1
+            self._entries.clear()
+        finally:
+            self._lock.release()
+
+    def stats (self):
+        """Returns a dictionary with the cache counters"""
+        self._lock.acquire()
+        try:
+            return {'hits': self.hits, \
+                    'misses': self.misses, \
+                    'evictions': self.evictions, \
+                    'invalidations': self.invalidations, \
+                    'size': len(self._entries)}
+        finally:
+            self._lock.release()
+
+class SingleFlight (object):
+    """Single Flight
+
+    Coalesces concurrent identical read-only commands: while
+    a command is in flight, other callers sending the same
+    command with the same parameters wait for it and get a
+    copy of its response (or its exception) instead of
+    sending a request of their own.
+
+    Instances are safe to share between threads, but not
+    between Api objects logged in as different users.
+    """
+    def __init__ (self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.sent = 0
+        self.shared = 0
+
+    def do (self, cmd, parameters, fn, timeout=None):
+        """Do
+
+        Returns fn(cmd, parameters), unless the same command
+        is already in flight, in which case a copy of its
+        response is returned once it arrives, waiting up to
+        timeout seconds (forever if None) before raising
+        TimeoutError
+        """
+        key = _make_key(cmd, parameters)
+        self._lock.acquire()
+        try:
+            call = self._calls.get(key)
+            if call is None:
+                # [future, number of callers waiting for it]
+                call = self._calls[key] = [Future(), 0]
+                self.sent += 1
+                leader = True
+            else:
+                call[1] += 1
+                self.shared += 1
+                leader = False
+        finally:
+            self._lock.release()
+
+        if not leader:
+            return copy.deepcopy(call[0].result(timeout))
+
+        try:
+            result = fn(cmd, parameters)
+        except:
+            self._forget(key, call)
+            call[0].set_exception(sys.exc_info())
+            raise
+        # The caller may modify the response it gets, so
+        # the waiters share a copy taken before returning it
+        if self._forget(key, call):
+            call[0].set_result(copy.deepcopy(result))
+        else:
+            call[0].set_result(None)
+        return result
+
+    def _forget (self, key, call):
+        """Stops new callers from joining a call and
+           returns the number of callers waiting for it"""
+        self._lock.acquire()
+        try:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+            return call[1]
+        finally:
+            self._lock.release()
+
+    def forget (self):
+        """Forget
+
+        Makes callers arriving from now on send new requests
+        instead of joining the ones in flight, whose responses
+        may predate a change made to the server
+        """
+        self._lock.acquire()
+        try:
+            self._calls = {}
+        finally:
+            self._lock.release()
+
+    def stats (self):
+        """Returns a dictionary with the number of requests
+           sent and of callers that shared a response"""
+        self._lock.acquire()
+        try:
+            return {'sent': self.sent, \
+                    'shared': self.shared, \
+                    'in_flight': len(self._calls)}
+        finally:
+            self._lock.release()
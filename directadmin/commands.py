@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""Declarative description of the commands of the API
+
+This file is part of python-directadmin.
+
+python-directadmin is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+python-directadmin is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with python-directadmin.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import urllib
+
+# Parameter name -> its url-encoded form, names are few
+_quoted_names = {}
+_max_quoted_names = 1024
+
+# Commands that list the users, affected by account changes
+_user_lists = ('CMD_API_SHOW_ALL_USERS', \
+               'CMD_API_SHOW_USERS', \
+               'CMD_API_SHOW_RESELLERS', \
+               'CMD_API_SHOW_ADMINS')
+
+class Command (object):
+    """Command
+
+    Description of a command of the API:
+
+    name -- command name
+    required -- parameters every request must include
+    optional -- other parameters accepted, None if any is
+    read_only -- True if the command never modifies the server,
+                 or a tuple of the values of the 'action'
+                 parameter for which it does not (None standing
+                 for requests without an action)
+    shape -- shape of the response to read-only requests:
+             'list' (the items of list[]), 'dict' or 'status'
+    ttl -- seconds its responses are cached by default,
+           zero if they are not
+    invalidates -- list of (cached command, parameters that must
+                   match) whose cached responses are outdated by
+                   the requests that modify the server
+
+    The path of the requests is computed once, here, so
+    sending a command only needs to encode its parameters.
+    """
+    __slots__ = ('name', 'required', 'optional', 'read_only', 'shape', \
+                 'ttl', 'invalidates', 'path', 'json_path')
+
+    def __init__ (self, name, required=(), optional=None, read_only=False, \
+                  shape='status', ttl=0, invalidates=()):
+        self.name = name
+        self.required = tuple(required)
+        if optional is not None:
+            optional = frozenset(optional)
+        self.optional = optional
+        self.read_only = read_only
+        self.shape = shape
+        self.ttl = ttl
+        self.invalidates = list(invalidates)
+        self.path = '/%s' % name
+        self.json_path = '/%s?json=yes' % name
+
+    def is_read_only (self, parameters=None):
+        """Returns True if a request with the given
+           parameters only reads from the server"""
+        if self.read_only is True or self.read_only is False:
+            return self.read_only
+        action = None
+        for key, value in parameters or ():
+            if key == 'action':
+                action = value
+        return action in self.read_only
+
+    def check (self, parameters):
+        """Check
+
+        Raises ValueError if a required parameter is missing
+        or a parameter is not accepted by the command
+
+        Parameters:
+        parameters -- list of (name, value) tuples
+        """
+        names = set(key for key, value in parameters or ())
+        for key in self.required:
+            if key not in names:
+                raise ValueError("%s requires the parameter %s" % \
+                                 (self.name, key))
+        if self.optional is not None:
+            for key in names:
+                if key not in self.optional and key not in self.required:
+                    raise ValueError("%s does not accept the parameter %s" % \
+                                     (self.name, key))
+
+    def __repr__ (self):
+        return "<Command %s>" % self.name
+
+_commands = [
+    # Accounts
+    Command('CMD_API_ACCOUNT_ADMIN', ('action', 'username'), \
+            invalidates=[(cmd, ()) for cmd in _user_lists]),
+    Command('CMD_API_ACCOUNT_RESELLER', ('action', 'username'), \
+            invalidates=[(cmd, ()) for cmd in _user_lists]),
+    Command('CMD_API_ACCOUNT_USER', ('action', 'username'), \
+            invalidates=[(cmd, ()) for cmd in _user_lists]),
+    Command('CMD_API_SELECT_USERS', \
+            invalidates=[(cmd, ()) for cmd in _user_lists] + \
+                        [('CMD_API_SHOW_USER_CONFIG', ()), \
+                         ('CMD_API_SHOW_USER_USAGE', ())]),
+    Command('CMD_API_CHANGE_INFO', ('evalue', 'domain', 'email'), ()),
+
+    # Users and resellers
+    Command('CMD_API_SHOW_ALL_USERS', (), (), True, 'list', 60),
+    Command('CMD_API_SHOW_USERS', (), ('reseller',), True, 'list', 60),
+    Command('CMD_API_SHOW_RESELLERS', (), (), True, 'list', 60),
+    Command('CMD_API_SHOW_ADMINS', (), (), True, 'list', 60),
+    Command('CMD_API_SHOW_RESELLER_IPS', (), ('ip',), True, 'list', 300),
+    Command('CMD_API_SHOW_USER_USAGE', ('user',), (), True, 'dict'),
+    Command('CMD_API_SHOW_USER_CONFIG', ('user',), (), True, 'dict'),
+    Command('CMD_API_SHOW_USER_DOMAINS', ('user',), (), True, 'dict'),
+    Command('CMD_API_ADMIN_STATS', (), (), True, 'dict'),
+    Command('CMD_API_PACKAGES_RESELLER', (), ('package',), True, 'list', 300),
+    Command('CMD_API_PACKAGES_USER', (), ('package',), True, 'list', 300),
+
+    # Domains and databases
+    Command('CMD_API_SHOW_DOMAINS', (), (), True, 'list', 60),
+    Command('CMD_API_SUBDOMAINS', ('domain',), None, (None,), 'list', 60, \
+            [('CMD_API_SUBDOMAINS', ('domain',))]),
+    Command('CMD_API_DATABASES', (), None, (None,), 'list', \
+            invalidates=[('CMD_API_DATABASES', ())]),
+
+    # E-mail
+    Command('CMD_API_POP', ('action', 'domain'), None, ('list',), 'list', \
+            invalidates=[('CMD_API_POP', ('domain',))]),
+    Command('CMD_API_CHANGE_EMAIL_PASSWORD', \
+            ('email', 'oldpassword', 'password1', 'password2'), ('api',)),
+    Command('CMD_API_EMAIL_AUTH', ('email', 'passwd'), ()),
+    Command('CMD_API_EMAIL_VACATION', ('domain',), None, (None,), 'list', \
+            invalidates=[('CMD_API_EMAIL_VACATION', ('domain',)), \
+                         ('CMD_API_EMAIL_VACATION_MODIFY', ('domain',))]),
+    Command('CMD_API_EMAIL_VACATION_MODIFY', ('domain', 'user'), (), \
+            True, 'dict'),
+]
+
+# Command name -> Command
+COMMANDS = dict((command.name, command) for command in _commands)
+
+def encode (parameters):
+    """Encode
+
+    Returns a list of (name, value) parameters url-encoded,
+    exactly as urllib.urlencode does, with the encoded names
+    remembered between calls
+    """
+    parts = []
+    for key, value in parameters:
+        name = _quoted_names.get(key)
+        if name is None:
+            name = urllib.quote_plus(str(key))
+            if len(_quoted_names) < _max_quoted_names:
+                _quoted_names[key] = name
+        parts.append('%s=%s' % (name, urllib.quote_plus(str(value))))
+    return '&'.join(parts)
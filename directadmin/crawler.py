@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+"""Crawler running fleet commands in several processes
+
+This file is part of python-directadmin.
+
+python-directadmin is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+python-directadmin is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with python-directadmin.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import Queue
+import pickle
+import hashlib
+import multiprocessing
+
+from api import ApiError
+from fleet import Fleet, FleetResult, read_servers_config
+
+# Seconds between checks that the workers are still alive
+_POLL_INTERVAL = 1.0
+
+def assign_worker (server, workers):
+    """Assign worker
+
+    Returns the index of the worker a server belongs to,
+    among `workers` of them. The assignment only depends
+    on the server name, and changing the number of workers
+    only moves the servers of the added or removed ones
+    (rendezvous hashing)
+    """
+    best = None
+    chosen = 0
+    for n in range(workers):
+        weight = hashlib.md5("%s:%d" % (server, n)).digest()
+        if best is None or weight > best:
+            best = weight
+            chosen = n
+    return chosen
+
+def _portable_error (error):
+    """Returns an exception that can be sent to the parent
+       process: the error itself, or an ApiError with its text"""
+    try:
+        pickle.dumps(error, pickle.HIGHEST_PROTOCOL)
+        return error
+    except Exception:
+        return ApiError("%s: %s" % (error.__class__.__name__, error))
+
+def _worker_main (servers, concurrency, per_host, tasks, results):
+    """Worker process: runs the tasks of its servers with a
+       Fleet of its own and sends back the results as they
+       finish, reduced if the task asks for it"""
+    fleet = Fleet(servers, concurrency, per_host)
+
+    def send (crawl, server, reduce, future):
+        error = future.exception()
+        if error is None:
+            try:
+                value = future.result()
+                if reduce is not None:
+                    value = reduce(value)
+                results.put((crawl, server, value, None))
+                return
+            except Exception, e:
+                error = e
+        results.put((crawl, server, None, _portable_error(error)))
+
+    try:
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            crawl, server, method, args, kwargs, reduce = task
+            try:
+                future = fleet.submit(server, method, *args, **kwargs)
+            except Exception, e:
+                results.put((crawl, server, None, _portable_error(e)))
+                continue
+            future.add_done_callback(lambda future, crawl=crawl, \
+                                     server=server, reduce=reduce: \
+                                     send(crawl, server, reduce, future))
+    finally:
+        fleet.close()
+        results.close()
+        results.join_thread()
+
+class FleetCrawler (object):
+    """Fleet Crawler
+
+    Runs Api methods on many servers like Fleet, but spread
+    over several processes, so parsing the responses and
+    building the results use more than one CPU core.
+
+    Every server is always handled by the same worker
+    process (see assign_worker), which keeps its own Api
+    objects and keep-alive connections. Results are sent
+    back to the parent as soon as each server finishes; a
+    `reduce` function applied in the worker keeps them
+    small, e.g. len for listings.
+
+    Methods, arguments, reduce functions, return values and
+    errors travel between processes, so they must be picklable:
+    reduce functions must be defined at module level. A
+    crawler runs one crawl at a time.
+
+    Usage:
+
+    crawler = FleetCrawler.from_config("~/.daconsole.conf", processes=4)
+    for result in crawler.crawl("list_all_users", reduce=len):
+        print result.server, result.value
+    crawler.close()
+    """
+    def __init__ (self, servers, processes=None, concurrency=20, \
+                  per_host=2):
+        """Constructor
+
+        Parameters:
+        servers -- dictionary of server name -> options, as
+                   for Fleet
+        processes -- number of worker processes (default: None,
+                     one per CPU core)
+        concurrency -- maximum number of calls in flight in each
+                       process (default: 20)
+        per_host -- maximum number of calls in flight on a single
+                    server (default: 2)
+        """
+        if processes is None:
+            processes = multiprocessing.cpu_count()
+        if processes < 1:
+            raise ValueError("processes must be greater than zero")
+        self._servers = dict(servers)
+        self._concurrency = concurrency
+        self._per_host = per_host
+        self._crawls = 0
+        self._assignment = {}
+        self._shards = [{} for n in range(processes)]
+        for name, options in self._servers.items():
+            n = assign_worker(name, processes)
+            self._assignment[name] = n
+            self._shards[n][name] = options
+        self._results = multiprocessing.Queue()
+        self._tasks = [None] * processes
+        self._processes = [None] * processes
+        for n in range(processes):
+            self._start(n)
+
+    def _start (self, n):
+        """Starts the worker process of a shard"""
+        tasks = multiprocessing.Queue()
+        process = multiprocessing.Process(target=_worker_main, \
+                                          args=(self._shards[n], \
+                                                self._concurrency, \
+                                                self._per_host, tasks, \
+                                                self._results))
+        process.daemon = True
+        process.start()
+        self._tasks[n] = tasks
+        self._processes[n] = process
+
+    def from_config (cls, path, **kwargs):
+        """Builds a FleetCrawler from a da_console configuration
+           file. Keyword arguments are passed to the constructor"""
+        return cls(read_servers_config(path), **kwargs)
+    from_config = classmethod(from_config)
+
+    def servers (self):
+        """Returns the sorted list of server names"""
+        return sorted(self._servers.keys())
+
+    def worker_of (self, server):
+        """Returns the index of the process handling a server"""
+        return self._assignment[server]
+
+    def crawl (self, method, args=(), kwargs=None, servers=None, \
+               reduce=None):
+        """Crawl
+
+        Runs an Api method on all the servers (or a subset of
+        them) and yields a FleetResult for each server as soon
+        as it finishes.
+
+        If a worker process dies, its servers that had not
+        finished yet are yielded with an ApiError, and it is
+        started again for the next crawl.
+
+        Parameters:
+        method -- name of the Api method (e.g. 'get_server_stats')
+        args -- tuple of positional arguments for the method
+        kwargs -- dictionary of keyword arguments for the method
+        servers -- list of server names (default: all servers)
+        reduce -- function applied to the value of every server
+                  in the worker process (default: None)
+        """
+        if kwargs is None:
+            kwargs = {}
+        if servers is None:
+            servers = self.servers()
+        for n, process in enumerate(self._processes):
+            if not process.is_alive():
+                self._start(n)
+        # Results of an abandoned crawl are told apart and dropped
+        self._crawls += 1
+        crawl = self._crawls
+        pending = set()
+        for server in servers:
+            n = self._assignment[server]
+            self._tasks[n].put((crawl, server, method, tuple(args), \
+                                kwargs, reduce))
+            pending.add(server)
+
+        while pending:
+            try:
+                result = self._results.get(True, _POLL_INTERVAL)
+            except Queue.Empty:
+                for server in sorted(pending):
+                    n = self._assignment[server]
+                    if not self._processes[n].is_alive():
+                        pending.discard(server)
+                        yield FleetResult(server, error=ApiError(\
+                            "worker process %d exited" % n))
+                continue
+            number, server, value, error = result
+            if number != crawl or server not in pending:
+                continue
+            pending.discard(server)
+            yield FleetResult(server, value, error)
+
+    def crawl_all (self, method, args=(), kwargs=None, servers=None, \
+                   reduce=None):
+        """Crawl all
+
+        Same as crawl, but waits for every server and returns a
+        tuple of two dictionaries: server -> value for the
+        servers that succeeded and server -> exception for
+        the ones that failed
+        """
+        results = {}
+        errors = {}
+        for result in self.crawl(method, args, kwargs, servers, reduce):
+            if result.ok():
+                results[result.server] = result.value
+            else:
+                errors[result.server] = result.error
+        return results, errors
+
+    def close (self):
+        """Waits for the pending calls and stops the worker processes"""
+        for tasks in self._tasks:
+            tasks.put(None)
+        # Workers cannot exit while they have results to send,
+        # so keep reading them, from abandoned crawls too
+        for process in self._processes:
+            while process.is_alive():
+                try:
+                    self._results.get(True, 0.1)
+                except Queue.Empty:
+                    pass
+            process.join()
+        self._tasks = []
+        self._processes = []
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""Deadlines shared by the requests of composite operations
+
+This file is part of python-directadmin.
+
+python-directadmin is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+python-directadmin is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with python-directadmin.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import time
+import threading
+
+_local = threading.local()
+
+class Deadline (object):
+    """Deadline
+
+    Time budget for one or more commands. While a deadline
+    is active in a thread (inside a `with deadline:` block, or
+    in a function returned by wrap), every command sent by
+    that thread times out when the budget runs out, and no
+    command is sent once it has run out: DeadlineExceeded is
+    raised instead.
+
+    The same deadline can be active in several threads at
+    once, so the workers of a composite operation share it.
+
+    Usage:
+
+    deadline = Deadline(10)
+    with deadline:
+        usage = api.get_user_usage("user1")
+        limits = api.get_user_limits("user1")
+    """
+    def __init__ (self, seconds):
+        """Constructor
+
+        Parameters:
+        seconds -- time budget, from now
+        """
+        self.end = time.time() + seconds
+
+    def remaining (self):
+        """Returns the seconds left, zero if it expired"""
+        return max(0, self.end - time.time())
+
+    def expired (self):
+        """Returns True if the budget has run out"""
+        return time.time() >= self.end
+
+    def __enter__ (self):
+        stack = getattr(_local, 'stack', None)
+        if stack is None:
+            stack = _local.stack = []
+        stack.append(self)
+        return self
+
+    def __exit__ (self, exc_type, exc_value, traceback):
+        _local.stack.pop()
+        return False
+
+    def wrap (self, fn):
+        """Returns a function that runs fn with this deadline
+           active, to be run by another thread"""
+        def run (*args, **kwargs):
+            self.__enter__()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.__exit__(None, None, None)
+        return run
+
+    def __repr__ (self):
+        return "<Deadline %.3fs left>" % self.remaining()
+
+def current_deadline ():
+    """Returns the deadline that ends first among the ones
+       active in the current thread, or None"""
+    stack = getattr(_local, 'stack', None)
+    if not stack:
+        return None
+    return min(stack, key=lambda deadline: deadline.end)
@@ -0,0 +1,281 @@
+# -*- coding: utf-8 -*-
+"""Prometheus exporter for server stats and user usage
+
+This file is part of python-directadmin.
+
+python-directadmin is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+python-directadmin is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with python-directadmin.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import time
+import threading
+import BaseHTTPServer
+import SocketServer
+
+# UserUsage fields exported by default
+DEFAULT_USER_FIELDS = ('bandwidth', 'quota')
+
+def _escape (value):
+    """Escapes a label value"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"') \
+                     .replace('\n', '\\n')
+
+def _number (value):
+    """Returns True if a value can be exported"""
+    return isinstance(value, (int, long, float)) and \
+           not isinstance(value, bool)
+
+def _format (value):
+    """Formats a number for the text format: repr would
+       add an L to longs and spell infinities differently"""
+    if isinstance(value, (int, long)):
+        return '%d' % value
+    if value != value:
+        return 'NaN'
+    if value in (float('inf'), float('-inf')):
+        return value > 0 and '+Inf' or '-Inf'
+    return repr(value)
+
+class Exporter (object):
+    """Exporter
+
+    Polls a server on a schedule and keeps the latest values
+    of get_server_stats and of the usage of every user in
+    memory, rendered in the Prometheus text format by render().
+    Rendering never calls the server.
+
+    Every poll fetches the server stats and the list of
+    users at once, and then the usage of the users one at a
+    time, spread over the polling interval, so the server
+    never sees a burst of requests.
+
+    Usage:
+
+    exporter = Exporter(api, interval=60)
+    exporter.start()
+    exporter.serve(("127.0.0.1", 9222))
+    """
+    def __init__ (self, api, interval=60, user_fields=DEFAULT_USER_FIELDS):
+        """Constructor
+
+        Parameters:
+        api -- Api object
+        interval -- seconds between polls (default: 60)
+        user_fields -- UserUsage fields exported for every
+                       user, empty to skip users
+                       (default: bandwidth and quota)
+        """
+        self._api = api
+        self._interval = interval
+        self._user_fields = tuple(user_fields)
+        self._stats = None
+        self._users = {}
+        self._up = 0
+        self._last_poll = 0
+        self._poll_errors = 0
+        self._rendered = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _update (self, fn):
+        """Applies fn to the snapshot, holding the lock"""
+        self._lock.acquire()
+        try:
+            fn()
+            self._rendered = None
+        finally:
+            self._lock.release()
+
+    def _failed (self):
+        """Counts a failed request"""
+        def update ():
+            self._poll_errors += 1
+        self._update(update)
+
+    def poll (self):
+        """Poll
+
+        Runs one polling round: the server stats and the user
+        list right away, and the usage of every user spread
+        over the interval. Returns early if stop() is called.
+
+        Any error reading the stats or the user list sets up
+        to zero; errors reading a user only count as errors.
+        """
+        try:
+            stats = self._api.get_server_stats(typed=True)
+            users = []
+            if self._user_fields:
+                users = self._api.list_all_users()
+                if not isinstance(users, list):
+                    users = []
+        except Exception:
+            def update ():
+                self._up = 0
+                self._poll_errors += 1
+            self._update(update)
+            self._stop.wait(self._interval)
+            return
+
+        def update ():
+            self._stats = stats
+            self._up = 1
+            self._last_poll = time.time()
+            # Forget the users that no longer exist
+            current = set(users)
+            for name in self._users.keys():
+                if name not in current:
+                    del self._users[name]
+        self._update(update)
+
+        start = time.time()
+        delay = float(self._interval) / max(1, len(users))
+        for n, name in enumerate(users):
+            if self._stop.isSet():
+                return
+            try:
+                usage = self._api.get_user_usage(name, typed=True)
+                # Fields missing from the response are not exported
+                values = tuple([usage.get(field) \
+                                for field in self._user_fields])
+            except Exception:
+                self._failed()
+            else:
+                def update ():
+                    self._users[name] = values
+                self._update(update)
+            self._stop.wait(max(0, start + (n + 1) * delay - time.time()))
+        if not users:
+            self._stop.wait(self._interval)
+
+    def _run (self):
+        """Polling loop, it only ends with stop()"""
+        while not self._stop.isSet():
+            try:
+                self.poll()
+            except Exception:
+                def update ():
+                    self._up = 0
+                    self._poll_errors += 1
+                self._update(update)
+                self._stop.wait(self._interval)
+
+    def start (self):
+        """Starts polling in a background thread"""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.setDaemon(True)
+        self._thread.start()
+
+    def stop (self):
+        """Stops polling"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def render (self):
+        """Returns the latest values in the Prometheus text format"""
+        self._lock.acquire()
+        try:
+            if self._rendered is None:
+                self._rendered = self._render()
+            return self._rendered
+        finally:
+            self._lock.release()
+
+    def _render (self):
+        """Renders the snapshot"""
+        lines = ['# TYPE directadmin_up gauge', \
+                 'directadmin_up %d' % self._up, \
+                 '# TYPE directadmin_last_poll_timestamp_seconds gauge', \
+                 'directadmin_last_poll_timestamp_seconds %.3f' % \
+                 self._last_poll, \
+                 '# TYPE directadmin_poll_errors_total counter', \
+                 'directadmin_poll_errors_total %d' % self._poll_errors]
+
+        if self._stats is not None:
+            stats = self._stats.as_dict()
+            for field in sorted(stats):
+                if _number(stats[field]):
+                    name = 'directadmin_server_%s' % field.lower()
+                    lines.append('# TYPE %s gauge' % name)
+                    lines.append('%s %s' % (name, _format(stats[field])))
+            try:
+                loads = [float(load) for load in \
+                         str(stats.get('loadavg') or '').replace(',', ' ') \
+                                                        .split()]
+            except ValueError:
+                loads = []
+            if loads:
+                lines.append('# TYPE directadmin_server_load gauge')
+                for period, load in zip(('1', '5', '15'), loads):
+                    lines.append('directadmin_server_load{period="%s"} %s' % \
+                                 (period, _format(load)))
+            disks = stats.get('disks') or []
+            for field in ('blocks', 'used', 'available', 'usedpercent'):
+                if not disks:
+                    break
+                name = 'directadmin_disk_%s' % field
+                lines.append('# TYPE %s gauge' % name)
+                for disk in disks:
+                    if _number(disk.get(field)):
+                        lines.append('%s{filesystem="%s",mounted="%s"} %s' % \
+                                     (name, _escape(disk['filesystem']), \
+                                      _escape(disk['mounted']), \
+                                      _format(disk[field])))
+
+        for n, field in enumerate(self._user_fields):
+            name = 'directadmin_user_%s' % field
+            lines.append('# TYPE %s gauge' % name)
+            for user in sorted(self._users):
+                value = self._users[user][n]
+                if _number(value):
+                    lines.append('%s{user="%s"} %s' % \
+                                 (name, _escape(user), _format(value)))
+        return '\n'.join(lines) + '\n'
+
+    def serve (self, address):
+        """Serves /metrics on an (host, port) address until
+           interrupted. Requests are answered from memory"""
+        server = ExporterServer(address, self)
+        try:
+            server.serve_forever()
+        finally:
+            server.server_close()
+
+class ExporterHandler (BaseHTTPServer.BaseHTTPRequestHandler):
+    """Answers /metrics with the snapshot of the exporter"""
+    def log_message (self, format, *args):
+        pass
+
+    def do_GET (self):
+        if self.path.split('?', 1)[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = self.server.exporter.render()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+class ExporterServer (SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """HTTP server of an Exporter"""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__ (self, address, exporter):
+        BaseHTTPServer.HTTPServer.__init__(self, address, ExporterHandler)
+        self.exporter = exporter
@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+"""Fleet - run API commands on many Directadmin servers at once
+
+This file is part of python-directadmin.
+
+python-directadmin is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+python-directadmin is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with python-directadmin.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import sys
+import threading
+import ConfigParser
+from collections import deque
+
+from api import Api
+from futures import Future, WorkerPool, as_completed
+
+def read_servers_config (path):
+    """Read servers config
+
+    Parses a configuration file in the same format used
+    by da_console (~/.daconsole.conf): one section per server
+    with hostname, port, username, password and
+    optionally https options.
+
+    Returns a dictionary of server name -> options. Raises
+    ConfigParser.NoOptionError if a server has no username
+    or password, as they cannot be asked for
+    """
+    parser = ConfigParser.SafeConfigParser()
+    parser.readfp(open(os.path.expanduser(path)))
+    servers = {}
+    for section in parser.sections():
+        for option in ('username', 'password'):
+            if not parser.has_option(section, option):
+                raise ConfigParser.NoOptionError(option, section)
+        servers[section] = dict(parser.items(section))
+    return servers
+
+def _is_true (value):
+    """Translates a config value to a boolean"""
+    if isinstance(value, basestring):
+        return value.lower() in ('1', 'yes', 'true', 'on')
+    return bool(value)
+
+class FleetResult (object):
+    """Fleet Result
+
+    Outcome of a command run on one server of the fleet.
+    If the command failed, error holds the exception
+    and value is None.
+    """
+    __slots__ = ('server', 'value', 'error')
+
+    def __init__ (self, server, value=None, error=None):
+        self.server = server
+        self.value = value
+        self.error = error
+
+    def ok (self):
+        """Returns True if the command succeeded"""
+        return self.error is None
+
+    def __repr__ (self):
+        if self.error is not None:
+            return "<FleetResult %s error=%r>" % (self.server, self.error)
+        return "<FleetResult %s ok>" % self.server
+
+class Fleet (object):
+    """Fleet
+
+    A set of Directadmin servers on which API methods
+    can be run concurrently.
+
+    At most `concurrency` calls are in flight overall,
+    and at most `per_host` on any single server, so a slow
+    server never takes all the workers.
+
+    Usage:
+
+    fleet = Fleet.from_config("~/.daconsole.conf", per_host=2)
+    for result in fleet.run("list_all_users"):
+        if result.ok():
+            print result.server, len(result.value)
+        else:
+            print result.server, "failed:", result.error
+    fleet.close()
+    """
+    def __init__ (self, servers, concurrency=20, per_host=2, \
+                  pool_idle_timeout=60):
+        """Constructor
+
+        Parameters:
+        servers -- dictionary of server name -> options with keys
+                   hostname, port, username, password and https
+        concurrency -- maximum number of calls in flight (default: 20)
+        per_host -- maximum number of calls in flight on a single
+                    server (default: 2)
+        pool_idle_timeout -- seconds after which an idle pooled
+                             connection is closed (default: 60)
+        """
+        if per_host < 1:
+            raise ValueError("per_host must be greater than zero")
+        self._per_host = int(per_host)
+        self._workers = WorkerPool(concurrency)
+        self._lock = threading.Lock()
+        self._apis = {}
+        self._pending = {}
+        self._active = {}
+        for name, options in servers.items():
+            self._apis[name] = Api(options['username'], \
+                                   options['password'], \
+                                   options.get('hostname', name), \
+                                   options.get('port', 2222), \
+                                   _is_true(options.get('https', False)), \
+                                   self._per_host, \
+                                   pool_idle_timeout)
+            self._pending[name] = deque()
+            self._active[name] = 0
+
+    def from_config (cls, path, **kwargs):
+        """Builds a Fleet from a da_console configuration file.
+           Keyword arguments are passed to the constructor"""
+        return cls(read_servers_config(path), **kwargs)
+    from_config = classmethod(from_config)
+
+    def servers (self):
+        """Returns the sorted list of server names"""
+        return sorted(self._apis.keys())
+
+    def get_api (self, server):
+        """Returns the Api instance of a server"""
+        return self._apis[server]
+
+    def submit (self, server, method, *args, **kwargs):
+        """Submit
+
+        Schedules an Api method to be run on a server
+        and returns a Future for its result
+
+        Parameters:
+        server -- server name
+        method -- name of the Api method (e.g. 'list_all_users')
+        """
+        fn = getattr(self._apis[server], method)
+        future = Future()
+        self._lock.acquire()
+        try:
+            self._pending[server].append((future, fn, args, kwargs))
+        finally:
+            self._lock.release()
+        self._dispatch(server)
+        return future
+
+    def _dispatch (self, server):
+        """Hands pending calls of a server to the workers
+           while it has free slots"""
+        self._lock.acquire()
+        try:
+            while self._pending[server] and \
+                  self._active[server] < self._per_host:
+                task = self._pending[server].popleft()
+                self._active[server] += 1
+                self._workers.submit(self._run_task, server, *task)
+        finally:
+            self._lock.release()
+
+    def _run_task (self, server, future, fn, args, kwargs):
+        """Runs a call and frees its server slot"""
+        try:
+            if future.set_running():
+                try:
+                    result = fn(*args, **kwargs)
+                except:
+                    future.set_exception(sys.exc_info())
+                else:
+                    future.set_result(result)
+        finally:
+            self._lock.acquire()
+            try:
+                self._active[server] -= 1
+            finally:
+                self._lock.release()
+            self._dispatch(server)
+
+    def run (self, method, args=(), kwargs=None, servers=None, timeout=None):
+        """Run
+
+        Runs an Api method on all the servers (or a subset of them)
+        and yields a FleetResult for each server as soon as it
+        finishes, so slow servers do not hold up the others.
+
+        Parameters:
+        method -- name of the Api method (e.g. 'get_server_stats')
+        args -- tuple of positional arguments for the method
+        kwargs -- dictionary of keyword arguments for the method
+        servers -- list of server names (default: all servers)
+        timeout -- seconds to wait for all the results,
+                   None waits forever (default: None)
+
+        Raises futures.TimeoutError if the timeout expires
+        """
+        if kwargs is None:
+            kwargs = {}
+        if servers is None:
+            servers = self.servers()
+        futures = {}
+        for server in servers:
+            future = self.submit(server, method, *args, **kwargs)
+            futures[future] = server
+        for future in as_completed(futures.keys(), timeout):
+            server = futures[future]
+            error = future.exception()
+            if error is not None:
+                yield FleetResult(server, error=error)
+            else:
+                yield FleetResult(server, future.result())
+
+    def run_all (self, method, args=(), kwargs=None, servers=None, \
+                 timeout=None):
+        """Run all
+
+        Same as run, but waits for every server and returns a
+        tuple of two dictionaries: server -> value for the
+        servers that succeeded and server -> exception for
+        the ones that failed
+        """
+        results = {}
+        errors = {}
+        for result in self.run(method, args, kwargs, servers, timeout):
+            if result.ok():
+                results[result.server] = result.value
+            else:
+                errors[result.server] = result.error
+        return results, errors
+
+    def close (self):
+        """Waits for the pending calls and closes all the connections"""
+        self._workers.shutdown()
+        for api in self._apis.values():
+            api.close()
@@ -0,0 +1,288 @@
+# -*- coding: utf-8 -*-
+"""Futures and worker pools for concurrent API calls
+
+This file is part of python-directadmin.
+
+python-directadmin is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+python-directadmin is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with python-directadmin.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import sys
+import time
+import threading
+import Queue
+
+_PENDING = 'pending'
+_RUNNING = 'running'
+_CANCELLED = 'cancelled'
+_FINISHED = 'finished'
+
+class CancelledError (Exception):
+    """Raised when the result of a cancelled Future is requested"""
+    pass
+
+class TimeoutError (Exception):
+    """Raised when waiting for a Future takes too long"""
+    pass
+
+class Future (object):
+    """Future
+
+    Placeholder for the result of a call that runs
+    in the background. The caller can block on it with
+    result() or register callbacks to be run once it is done.
+    """
+    def __init__ (self):
+        self._condition = threading.Condition()
+        self._state = _PENDING
+        self._result = None
+        self._exc_info = None
+        self._callbacks = []
+
+    def cancel (self):
+        """Cancels the call if it has not started yet.
+           Returns True if the call was cancelled"""
+        self._condition.acquire()
+        try:
+            if self._state == _CANCELLED:
+                return True
+            if self._state != _PENDING:
+                return False
+            self._state = _CANCELLED
+            self._condition.notifyAll()
+        finally:
+            self._condition.release()
+        self._run_callbacks()
+        return True
+
+    def cancelled (self):
+        """Returns True if the call was cancelled"""
+        return self._state == _CANCELLED
+
+    def running (self):
+        """Returns True if the call is being executed"""
+        return self._state == _RUNNING
+
+    def done (self):
+        """Returns True if the call finished or was cancelled"""
+        return self._state in (_CANCELLED, _FINISHED)
+
+    def set_running (self):
+        """Marks the future as running.
+           Returns False if it was cancelled in the meantime"""
+        self._condition.acquire()
+        try:
+            if self._state == _CANCELLED:
+                return False
+            self._state = _RUNNING
+            return True
+        finally:
+            self._condition.release()
+
+    def _wait (self, timeout):
+        """Waits until the future is done or the timeout expires"""
+        self._condition.acquire()
+        try:
+            if not self.done():
+                self._condition.wait(timeout)
+            if self._state == _CANCELLED:
+                raise CancelledError()
+            if self._state != _FINISHED:
+                raise TimeoutError()
+        finally:
+            self._condition.release()
+
+    def result (self, timeout=None):
+        """Result
+
+        Returns the value returned by the call, waiting
+        up to timeout seconds (forever if None).
+        If the call raised an exception, it is raised again here.
+
+        Raises CancelledError if the call was cancelled and
+        TimeoutError if the timeout expired
+        """
+        self._wait(timeout)
+        if self._exc_info is not None:
+            raise self._exc_info[0], self._exc_info[1], self._exc_info[2]
+        return self._result
+
+    def exception (self, timeout=None):
+        """Returns the exception raised by the call, or None"""
+        self._wait(timeout)
+        if self._exc_info is not None:
+            return self._exc_info[1]
+        return None
+
+    def add_done_callback (self, fn):
+        """Registers a function to be called with the future
+           as its only argument once it is done"""
+        self._condition.acquire()
+        try:
+            if not self.done():
+                self._callbacks.append(fn)
+                return
+        finally:
+            self._condition.release()
+        fn(self)
+
+    def set_result (self, result):
+        """Sets the result of the call"""
+        self._finish(result, None)
+
+    def set_exception (self, exc_info):
+        """Sets the exception raised by the call
+
+        Parameters:
+        exc_info -- tuple as returned by sys.exc_info()
+                    or an exception instance
+        """
+        if not isinstance(exc_info, tuple):
+            exc_info = (type(exc_info), exc_info, None)
+        self._finish(None, exc_info)
+
+    def _finish (self, result, exc_info):
+        """Stores the outcome and wakes up the waiters"""
+        self._condition.acquire()
+        try:
+            self._result = result
+            self._exc_info = exc_info
+            self._state = _FINISHED
+            self._condition.notifyAll()
+        finally:
+            self._condition.release()
+        self._run_callbacks()
+
+    def _run_callbacks (self):
+        """Runs the registered callbacks"""
+        self._condition.acquire()
+        try:
+            callbacks, self._callbacks = self._callbacks, []
+        finally:
+            self._condition.release()
+        for fn in callbacks:
+            fn(self)
+
+class WorkerPool (object):
+    """Worker Pool
+
+    A fixed-size pool of threads that run submitted calls
+    and report their outcome through Future objects.
+    The number of workers bounds how many calls run at once.
+    """
+    def __init__ (self, workers=10):
+        """Constructor
+
+        Parameters:
+        workers -- maximum number of calls running at once (default: 10)
+        """
+        if workers < 1:
+            raise ValueError("workers must be greater than zero")
+        self._max_workers = int(workers)
+        self._threads = []
+        self._queue = Queue.Queue()
+        self._lock = threading.Lock()
+        self._shutdown = False
+
+    def submit (self, fn, *args, **kwargs):
+        """Submit
+
+        Schedules fn(*args, **kwargs) to be run by a worker
+        and returns a Future for its result
+        """
+        future = Future()
+        self._lock.acquire()
+        try:
+            if self._shutdown:
+                raise RuntimeError("cannot submit calls after shutdown")
+            self._queue.put((future, fn, args, kwargs))
+            if len(self._threads) < self._max_workers:
+                thread = threading.Thread(target=self._work)
+                thread.setDaemon(True)
+                thread.start()
+                self._threads.append(thread)
+        finally:
+            self._lock.release()
+        return future
+
+    def map (self, fn, iterable):
+        """Submits fn(item) for every item and returns
+           the list of futures, in the same order"""
+        return [self.submit(fn, item) for item in iterable]
+
+    def _work (self):
+        """Worker loop"""
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            future, fn, args, kwargs = item
+            if not future.set_running():
+                continue
+            try:
+                result = fn(*args, **kwargs)
+            except:
+                future.set_exception(sys.exc_info())
+            else:
+                future.set_result(result)
+
+    def shutdown (self, wait=True):
+        """Shutdown
+
+        Stops the workers once the queued calls are done.
+        If wait is True, blocks until they finish.
+        """
+        self._lock.acquire()
+        try:
+            if self._shutdown:
+                return
+            self._shutdown = True
+            threads = list(self._threads)
+        finally:
+            self._lock.release()
+        for thread in threads:
+            self._queue.put(None)
+        if wait:
+            for thread in threads:
+                thread.join()
+
+def as_completed (futures, timeout=None):
+    """As completed
+
+    Yields the given futures as they finish (or are cancelled),
+    regardless of the order in which they were submitted.
+
+    Raises TimeoutError if they are not all done after
+    timeout seconds (wait forever if None)
+    """
+    if timeout is not None:
+        end = time.time() + timeout
+    done = Queue.Queue()
+    pending = 0
+    for future in futures:
+        future.add_done_callback(done.put)
+        pending += 1
+    while pending:
+        wait = None
+        if timeout is not None:
+            wait = max(0, end - time.time())
+        try:
+            yield done.get(True, wait)
+        except Queue.Empty:
+            raise TimeoutError()
+        pending -= 1
+
+def wait_all (futures, timeout=None):
+    """Waits for all the futures and returns their results
+       in the same order. The first exception found is raised"""
+    return [future.result(timeout) for future in futures]
@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+"""Local inventory of users, domains and usage
+
+This file is part of python-directadmin.
+
+python-directadmin is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+python-directadmin is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with python-directadmin.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import time
+import sqlite3
+
+from api import DeadlineExceeded
+from futures import WorkerPool
+from deadline import current_deadline
+
+_schema = """
+CREATE TABLE IF NOT EXISTS users (
+    username TEXT PRIMARY KEY,
+    reseller TEXT,
+    usertype TEXT,
+    email TEXT,
+    package TEXT,
+    suspended INTEGER,
+    quota_used REAL,
+    quota_limit REAL,
+    quota_percent REAL,
+    bandwidth_used REAL,
+    bandwidth_limit REAL,
+    bandwidth_percent REAL,
+    refreshed REAL
+);
+CREATE INDEX IF NOT EXISTS users_reseller ON users (reseller);
+CREATE INDEX IF NOT EXISTS users_quota_percent ON users (quota_percent);
+CREATE INDEX IF NOT EXISTS users_bandwidth_percent
+    ON users (bandwidth_percent);
+CREATE TABLE IF NOT EXISTS domains (
+    domain TEXT PRIMARY KEY,
+    username TEXT
+);
+CREATE INDEX IF NOT EXISTS domains_username ON domains (username);
+"""
+
+_columns = ('username', 'reseller', 'usertype', 'email', 'package', \
+            'suspended', 'quota_used', 'quota_limit', 'quota_percent', \
+            'bandwidth_used', 'bandwidth_limit', 'bandwidth_percent', \
+            'refreshed')
+
+def _percent (used, limit):
+    """Returns used as a percentage of limit, or None
+       if any of them is unknown or unlimited"""
+    if not isinstance(used, (int, long, float)) or \
+       not isinstance(limit, (int, long, float)) or limit <= 0:
+        return None
+    return used * 100.0 / limit
+
+def _domain_names (response):
+    """Returns the domains of a CMD_API_SHOW_USER_DOMAINS response"""
+    if isinstance(response, list):
+        return response
+    if isinstance(response, dict):
+        return response.keys()
+    return []
+
+def fetch_user (api, username):
+    """Fetch user
+
+    Returns a tuple (row, domains) with the inventory data of
+    a user, calling get_user_limits, get_user_usage and
+    get_user_domains
+    """
+    limits = api.get_user_limits(username, typed=True)
+    usage = api.get_user_usage(username, typed=True)
+    domains = _domain_names(api.get_user_domains(username))
+    row = {'username': username, \
+           'reseller': limits.creator, \
+           'usertype': limits.usertype, \
+           'email': limits.email, \
+           'package': limits.package, \
+           'suspended': int(limits.suspended == 'yes'), \
+           'quota_used': usage.quota, \
+           'quota_limit': limits.quota, \
+           'quota_percent': _percent(usage.quota, limits.quota), \
+           'bandwidth_used': usage.bandwidth, \
+           'bandwidth_limit': limits.bandwidth, \
+           'bandwidth_percent': _percent(usage.bandwidth, \
+                                         limits.bandwidth), \
+           'refreshed': time.time()}
+    return row, domains
+
+class Inventory (object):
+    """Inventory
+
+    Local SQLite copy of the users of a server with their
+    reseller, domains, usage and limits, indexed so that
+    questions like "which user owns this domain" or "who is
+    over 90% of their quota" are answered without calling
+    the server.
+
+    refresh() crawls the server concurrently. Only users that
+    were added since the last refresh, or whose data is older
+    than max_age seconds, are fetched again, and users that
+    no longer exist are removed.
+
+    Like sqlite3 connections, instances must be used from
+    the thread that created them.
+
+    Usage:
+
+    inventory = Inventory(api, "inventory.db", max_age=3600)
+    inventory.refresh()
+    print inventory.owner_of("example.com")
+    print inventory.over_quota(90)
+    """
+    def __init__ (self, api, path=":memory:", max_age=3600, workers=8):
+        """Constructor
+
+        Parameters:
+        api -- Api object
+        path -- SQLite database file (default: in memory)
+        max_age -- seconds after which the data of a user is
+                   fetched again (default: 3600)
+        workers -- number of users fetched at once (default: 8)
+        """
+        self._api = api
+        self._max_age = max_age
+        self._workers = int(workers)
+        self._db = sqlite3.connect(path)
+        self._db.text_factory = str
+        self._db.executescript(_schema)
+
+    def refresh (self, force=False, deadline=None):
+        """Refresh
+
+        Updates the inventory from the server and returns a
+        dictionary with the number of users added, updated,
+        removed, unchanged, failed and cancelled. Users that
+        could not be fetched keep their previous data.
+
+        Parameters:
+        force -- boolean, if True all users are fetched again
+                 (default: False)
+        deadline -- Deadline for the refresh: the users not
+                    fetched when it expires are counted as
+                    cancelled (default: None, the deadline of
+                    the caller if there is one)
+        """
+        if deadline is None:
+            deadline = current_deadline()
+        counts = {'added': 0, 'updated': 0, 'removed': 0, \
+                  'unchanged': 0, 'failed': 0, 'cancelled': 0}
+        fetch = fetch_user
+        if deadline is not None:
+            fetch = deadline.wrap(fetch_user)
+            deadline.__enter__()
+            try:
+                current = set(self._api.list_all_users())
+            finally:
+                deadline.__exit__(None, None, None)
+        else:
+            current = set(self._api.list_all_users())
+        known = dict(self._db.execute("SELECT username, refreshed " \
+                                      "FROM users"))
+
+        removed = [name for name in known if name not in current]
+        if removed:
+            self._db.executemany("DELETE FROM users WHERE username = ?", \
+                                 [(name,) for name in removed])
+            self._db.executemany("DELETE FROM domains WHERE username = ?", \
+                                 [(name,) for name in removed])
+            self._db.commit()
+            counts['removed'] = len(removed)
+
+        oldest = time.time() - self._max_age
+        stale = []
+        for name in sorted(current):
+            if name not in known or force or known[name] < oldest:
+                stale.append(name)
+            else:
+                counts['unchanged'] += 1
+
+        pool = WorkerPool(self._workers)
+        try:
+            futures = [(name, pool.submit(fetch, self._api, name)) \
+                       for name in stale]
+            # Rows are written from this thread, as sqlite requires
+            for name, future in futures:
+                try:
+                    row, domains = future.result()
+                except DeadlineExceeded:
+                    counts['cancelled'] += 1
+                    continue
+                except Exception:
+                    # Any other error only loses this user
+                    counts['failed'] += 1
+                    continue
+                self._store(row, domains)
+                if name in known:
+                    counts['updated'] += 1
+                else:
+                    counts['added'] += 1
+        finally:
+            pool.shutdown()
+            self._db.commit()
+        return counts
+
+    def _store (self, row, domains):
+        """Writes the data of a user, replacing the previous one"""
+        self._db.execute("INSERT OR REPLACE INTO users (%s) VALUES (%s)" % \
+                         (', '.join(_columns), \
+                          ', '.join('?' * len(_columns))), \
+                         [row[column] for column in _columns])
+        self._db.execute("DELETE FROM domains WHERE username = ?", \
+                         (row['username'],))
+        self._db.executemany("INSERT OR REPLACE INTO domains " \
+                             "(domain, username) VALUES (?, ?)", \
+                             [(domain, row['username']) \
+                              for domain in domains])
+
+    def _rows (self, query, parameters=()):
+        """Returns the users selected by a query as dictionaries"""
+        cursor = self._db.execute(query, parameters)
+        names = [description[0] for description in cursor.description]
+        return [dict(zip(names, row)) for row in cursor]
+
+    def user (self, username):
+        """Returns a dictionary with the data of a user,
+           including its 'domains', or None if it is unknown"""
+        rows = self._rows("SELECT * FROM users WHERE username = ?", \
+                          (username,))
+        if not rows:
+            return None
+        rows[0]['domains'] = self.domains_of(username)
+        return rows[0]
+
+    def users (self):
+        """Returns the names of all the users"""
+        return [row[0] for row in \
+                self._db.execute("SELECT username FROM users " \
+                                 "ORDER BY username")]
+
+    def owner_of (self, domain):
+        """Returns the user that owns a domain, or None"""
+        row = self._db.execute("SELECT username FROM domains " \
+                               "WHERE domain = ?", (domain,)).fetchone()
+        if row is None:
+            return None
+        return row[0]
+
+    def domains_of (self, username):
+        """Returns the domains of a user"""
+        return [row[0] for row in \
+                self._db.execute("SELECT domain FROM domains " \
+                                 "WHERE username = ? ORDER BY domain", \
+                                 (username,))]
+
+    def users_of (self, reseller):
+        """Returns the users created by a reseller"""
+        return [row[0] for row in \
+                self._db.execute("SELECT username FROM users " \
+                                 "WHERE reseller = ? ORDER BY username", \
+                                 (reseller,))]
+
+    def over_quota (self, percent=90):
+        """Returns the users using more than percent of their
+           disk quota, as dictionaries, the fullest first"""
+        return self._rows("SELECT * FROM users WHERE quota_percent > ? " \
+                          "ORDER BY quota_percent DESC", (percent,))
+
+    def over_bandwidth (self, percent=90):
+        """Returns the users using more than percent of their
+           bandwidth limit, as dictionaries, the highest first"""
+        return self._rows("SELECT * FROM users " \
+                          "WHERE bandwidth_percent > ? " \
+                          "ORDER BY bandwidth_percent DESC", (percent,))
+
+    def close (self):
+        """Closes the database"""
+        self._db.close()
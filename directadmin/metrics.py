@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""Per command metrics of API requests
+
+This file is part of python-directadmin.
+
+python-directadmin is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+python-directadmin is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with python-directadmin.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import bisect
+import threading
+
+from api import ApiError, ApiAuthError, ApiHttpError
+
+# Upper bounds, in seconds, of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, \
+                   0.5, 1.0, 2.5, 5.0, 10.0)
+
+def error_type (error):
+    """Returns the name under which an error is counted:
+       'auth', 'http', 'api' or the exception class name"""
+    if isinstance(error, ApiAuthError):
+        return 'auth'
+    if isinstance(error, ApiHttpError):
+        return 'http'
+    if isinstance(error, ApiError):
+        return 'api'
+    return error.__class__.__name__
+
+class CommandStats (object):
+    """Command Stats
+
+    Counters of a single command
+    """
+    __slots__ = ('calls', 'latency_sum', 'latency_counts', \
+                 'bytes_sent', 'bytes_received', 'bytes_decoded', 'errors')
+
+    def __init__ (self, buckets):
+        self.calls = 0
+        self.latency_sum = 0.0
+        # One counter per bucket plus one for slower requests
+        self.latency_counts = [0] * (len(buckets) + 1)
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.bytes_decoded = 0
+        self.errors = {}
+
+class Metrics (object):
+    """Metrics
+
+    Collects, per command name, a latency histogram, the
+    number of bytes sent and received and the number of
+    errors by type (auth, http, api). Compressed responses
+    count their size on the wire as received and their
+    decompressed size as decoded.
+
+    Pass an instance to Api (or ApiConnector) to enable it.
+    Instances are safe to share between threads and between
+    several Api objects.
+
+    Usage:
+
+    metrics = Metrics()
+    api = Api("admin", "password", "hostname.com", metrics=metrics)
+    ...
+    print metrics.as_dict()['CMD_API_SHOW_USER_USAGE']['calls']
+    """
+    def __init__ (self, buckets=LATENCY_BUCKETS):
+        """Constructor
+
+        Parameters:
+        buckets -- sorted upper bounds, in seconds, of the latency
+                   histogram buckets (default: LATENCY_BUCKETS)
+        """
+        self._buckets = tuple(buckets)
+        self._commands = {}
+        self._lock = threading.Lock()
+
+    def record (self, cmd, latency, sent, received, error=None, \
+                decoded=None):
+        """Record
+
+        Records a finished request
+
+        Parameters:
+        cmd -- command name
+        latency -- seconds the request took
+        sent -- bytes of the request body
+        received -- bytes of the response body
+        error -- exception raised by the request, if any
+        decoded -- bytes of the response body once decompressed
+                   (default: None, the same as received)
+        """
+        if decoded is None:
+            decoded = received
+        bucket = bisect.bisect_left(self._buckets, latency)
+        self._lock.acquire()
+        try:
+            stats = self._commands.get(cmd)
+            if stats is None:
+                stats = self._commands[cmd] = CommandStats(self._buckets)
+            stats.calls += 1
+            stats.latency_sum += latency
+            stats.latency_counts[bucket] += 1
+            stats.bytes_sent += sent
+            stats.bytes_received += received
+            stats.bytes_decoded += decoded
+            if error is not None:
+                name = error_type(error)
+                stats.errors[name] = stats.errors.get(name, 0) + 1
+        finally:
+            self._lock.release()
+
+    def as_dict (self):
+        """As dict
+
+        Exports the metrics as a dictionary of command name ->
+        dictionary with calls, latency_sum, latency_buckets
+        (cumulative counts keyed by upper bound, '+Inf' for all),
+        bytes_sent, bytes_received, bytes_decoded and errors
+        (by type)
+        """
+        self._lock.acquire()
+        try:
+            result = {}
+            for cmd, stats in self._commands.items():
+                buckets = {}
+                total = 0
+                for bound, count in zip(self._buckets, stats.latency_counts):
+                    total += count
+                    buckets[bound] = total
+                buckets['+Inf'] = stats.calls
+                result[cmd] = {'calls': stats.calls, \
+                               'latency_sum': stats.latency_sum, \
+                               'latency_buckets': buckets, \
+                               'bytes_sent': stats.bytes_sent, \
+                               'bytes_received': stats.bytes_received, \
+                               'bytes_decoded': stats.bytes_decoded, \
+                               'errors': dict(stats.errors)}
+            return result
+        finally:
+            self._lock.release()
+
+    def reset (self):
+        """Discards all the collected metrics"""
+        self._lock.acquire()
+        try:
+            self._commands = {}
+        finally:
+            self._lock.release()
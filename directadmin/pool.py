@@ -0,0 +1,344 @@
+# -*- coding: utf-8 -*-
+"""Connection pool for Directadmin API connections
+
+This file is part of python-directadmin.
+
+python-directadmin is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+python-directadmin is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with python-directadmin.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import errno
+import httplib
+import select
+import socket
+import threading
+import time
+
+from deadline import current_deadline
+
+def _set_timeout (conn, timeout):
+    """Sets the timeout of a connection, open or not.
+       None means the default socket timeout"""
+    if timeout is None:
+        timeout = socket.getdefaulttimeout()
+    conn.timeout = timeout
+    if conn.sock is not None:
+        conn.sock.settimeout(timeout)
+
+def _cap_timeout (timeout):
+    """Returns a timeout shortened to the time left by the
+       deadline of the current thread. Raises socket.timeout
+       if the deadline already expired"""
+    deadline = current_deadline()
+    if deadline is None:
+        return timeout
+    remaining = deadline.remaining()
+    # A zero timeout would make the socket non-blocking
+    if remaining <= 0:
+        raise socket.timeout("deadline exceeded")
+    if timeout is None or remaining < timeout:
+        return remaining
+    return timeout
+
+def _is_stale (error):
+    """Returns True if an error means the server had closed a
+       kept-alive connection before any byte of the response
+       arrived. Timeouts never do"""
+    if isinstance(error, socket.timeout):
+        return False
+    if isinstance(error, httplib.BadStatusLine):
+        # httplib reports an empty status line with this message
+        return not error.line or \
+               str(error.line).startswith("No status line received")
+    if isinstance(error, socket.error):
+        return error.errno in (errno.ECONNRESET, errno.EPIPE)
+    return False
+
+def _is_dropped (conn):
+    """Returns True if the server closed an idle connection:
+       its socket is readable although no request is pending"""
+    if conn.sock is None:
+        return False
+    try:
+        readable = select.select([conn.sock], [], [], 0)[0]
+    except (select.error, socket.error, ValueError):
+        return True
+    return bool(readable)
+
+def _can_resend (method, error, sent):
+    """Can resend
+
+    Returns True if a request that failed on a reused
+    connection may be sent again on a new one: the
+    connection was stale, and the request either failed
+    while being written or has no body. Commands that
+    modify the server always have a body, so they are
+    never sent twice here, that is left to the RetryPolicy
+
+    Parameters:
+    method -- HTTP method of the request
+    error -- exception raised
+    sent -- boolean, True if the request had been completely written
+    """
+    if not _is_stale(error):
+        return False
+    return not sent or method == "GET"
+
+class PooledResponse (object):
+    """Pooled Response
+
+    Fully buffered response read from a pooled connection.
+    It mimics the interface of the objects returned by
+    urllib2.urlopen, so it can be handled the same way.
+    """
+    def __init__ (self, status, reason, headers, body):
+        self.status = status
+        self.reason = reason
+        self._headers = headers
+        self._body = body
+
+    def info (self):
+        """Returns the response headers"""
+        return self._headers
+
+    def getcode (self):
+        """Returns the HTTP status code"""
+        return self.status
+
+    def read (self):
+        """Returns the response body"""
+        return self._body
+
+    def close (self):
+        pass
+
+class PooledStream (object):
+    """Pooled Stream
+
+    Response whose body is read incrementally from a pooled
+    connection. The connection goes back to the pool once
+    the body has been completely read, or is closed if the
+    stream is closed before that.
+    """
+    def __init__ (self, pool, conn, response):
+        self.status = response.status
+        self.reason = response.reason
+        self._pool = pool
+        self._conn = conn
+        self._response = response
+
+    def info (self):
+        """Returns the response headers"""
+        return self._response.msg
+
+    def getcode (self):
+        """Returns the HTTP status code"""
+        return self.status
+
+    def read (self, amt=None):
+        """Reads up to amt bytes of the body (all if None)"""
+        if self._conn is None:
+            return ''
+        data = self._response.read(amt)
+        if amt is None or not data or self._response.isclosed():
+            self._release()
+        return data
+
+    def _release (self):
+        """Hands the connection back to the pool"""
+        conn, self._conn = self._conn, None
+        if self._response.will_close:
+            conn.close()
+        else:
+            self._pool._put(conn)
+
+    def close (self):
+        """Closes the stream, dropping the connection
+           if the body was not completely read"""
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            conn.close()
+
+class ConnectionPool (object):
+    """Connection Pool
+
+    Keeps a set of persistent (keep-alive) HTTP or HTTPS
+    connections to a single Directadmin server, so consecutive
+    commands reuse an open socket instead of paying a new
+    TCP (and TLS) handshake on every call.
+
+    Connections idle for longer than idle_timeout seconds
+    are discarded, and a reused connection that was closed
+    by the server is transparently replaced by a new one.
+
+    Instances are safe to share between threads.
+    """
+    def __init__ (self, \
+                  hostname, \
+                  port, \
+                  https=False, \
+                  size=4, \
+                  idle_timeout=60):
+        """Constructor
+
+        Parameters:
+        hostname -- Directadmin's hostname
+        port -- port on which Directadmin listens
+        https -- boolean, if True HTTPS connections are used
+        size -- maximum number of idle connections kept open (default: 4)
+        idle_timeout -- seconds after which an idle connection
+                        is evicted (default: 60)
+        """
+        self._hostname = hostname
+        self._port = int(port)
+        self._https = bool(https)
+        self._size = int(size)
+        self._idle_timeout = idle_timeout
+        self._idle = []
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.reconnects = 0
+
+    def _new_connection (self):
+        """Opens a new connection to the server"""
+        if self._https:
+            return httplib.HTTPSConnection(self._hostname, self._port)
+        return httplib.HTTPConnection(self._hostname, self._port)
+
+    def _get (self):
+        """Get connection
+
+        Returns a tuple (connection, reused) taking the most
+        recently used idle connection, or a new one if there
+        are no idle connections left. Idle connections already
+        closed by the server are discarded
+        """
+        now = time.time()
+        self._lock.acquire()
+        try:
+            while self._idle:
+                conn, last_used = self._idle.pop()
+                if now - last_used <= self._idle_timeout and \
+                   not _is_dropped(conn):
+                    self.hits += 1
+                    return conn, True
+                self.evictions += 1
+                conn.close()
+            self.misses += 1
+        finally:
+            self._lock.release()
+        return self._new_connection(), False
+
+    def _put (self, conn):
+        """Returns a connection to the pool"""
+        self._lock.acquire()
+        try:
+            if len(self._idle) < self._size:
+                self._idle.append((conn, time.time()))
+                return
+            self.evictions += 1
+        finally:
+            self._lock.release()
+        conn.close()
+
+    def _send (self, method, path, body, headers, timeout=None):
+        """Send
+
+        Sends a request and returns a tuple (connection, response)
+        with the response headers already read.
+
+        If a reused connection turns out to have been closed by
+        the server before answering, the request is sent again,
+        once, on a new connection (see _can_resend).
+
+        timeout is the number of seconds socket operations may
+        block (None for the default socket timeout), shortened
+        before every attempt to the time left by the deadline
+        of the current thread, if any
+        """
+        if headers is None:
+            headers = {}
+        conn, reused = self._get()
+        while True:
+            sent = False
+            try:
+                _set_timeout(conn, _cap_timeout(timeout))
+                conn.request(method, path, body, headers)
+                sent = True
+                return conn, conn.getresponse()
+            except (socket.error, httplib.HTTPException), e:
+                conn.close()
+                if not reused or not _can_resend(method, e, sent):
+                    raise
+            self._lock.acquire()
+            self.reconnects += 1
+            self._lock.release()
+            conn, reused = self._new_connection(), False
+
+    def request (self, method, path, body=None, headers=None, timeout=None):
+        """Request
+
+        Sends a request through a pooled connection and
+        returns a PooledResponse with the whole body.
+
+        Raises socket.error or httplib.HTTPException on failures
+        """
+        conn, response = self._send(method, path, body, headers, timeout)
+        try:
+            data = response.read()
+        except:
+            conn.close()
+            raise
+        if response.will_close:
+            conn.close()
+        else:
+            self._put(conn)
+        return PooledResponse(response.status, \
+                              response.reason, \
+                              response.msg, \
+                              data)
+
+    def open (self, method, path, body=None, headers=None, timeout=None):
+        """Open
+
+        Sends a request through a pooled connection and
+        returns a PooledStream to read the body incrementally.
+
+        Raises socket.error or httplib.HTTPException on failures
+        """
+        conn, response = self._send(method, path, body, headers, timeout)
+        return PooledStream(self, conn, response)
+
+    def stats (self):
+        """Returns a dictionary with the pool counters"""
+        self._lock.acquire()
+        try:
+            return {'hits': self.hits, \
+                    'misses': self.misses, \
+                    'evictions': self.evictions, \
+                    'reconnects': self.reconnects, \
+                    'idle': len(self._idle)}
+        finally:
+            self._lock.release()
+
+    def close (self):
+        """Closes all the idle connections"""
+        self._lock.acquire()
+        try:
+            idle, self._idle = self._idle, []
+        finally:
+            self._lock.release()
+        for conn, last_used in idle:
+            conn.close()
@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+"""Bulk provisioning of users from CSV or JSON lines files
+
+This file is part of python-directadmin.
+
+python-directadmin is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+python-directadmin is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with python-directadmin.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import re
+import csv
+import Queue
+
+from api import EndUser, ResellerUser, json
+from futures import WorkerPool
+
+USERNAME_RE = re.compile(r'^[a-zA-Z0-9]{4,8}$')
+EMAIL_RE = re.compile(r'^[^@\s]+@[^@\s]+\.[^@\s]+$')
+DOMAIN_RE = re.compile(r'^([a-zA-Z0-9]([a-zA-Z0-9-]*[a-zA-Z0-9])?\.)+' \
+                       r'[a-zA-Z]{2,}$')
+
+# Columns that are not passed as user properties
+_reserved = ('type', 'username', 'email', 'password', \
+             'domain', 'package', 'ip')
+
+class ValidationError (ValueError):
+    """Raised when a row does not describe a valid user"""
+    pass
+
+def _open (source):
+    """Returns a file object for a path or file object"""
+    if isinstance(source, basestring):
+        return open(source, 'rb')
+    return source
+
+def read_csv (source):
+    """Read CSV
+
+    Lazily yields one dictionary per row of a CSV file
+    with a header line naming the columns
+
+    Parameters:
+    source -- path or file object
+    """
+    for row in csv.DictReader(_open(source)):
+        yield row
+
+def read_jsonl (source):
+    """Read JSON lines
+
+    Lazily yields one dictionary per non-blank line
+    of a JSON lines file
+
+    Parameters:
+    source -- path or file object
+    """
+    for line in _open(source):
+        if line.strip():
+            yield json.loads(line)
+
+def read_rows (path):
+    """Reads a CSV file or, if its name ends with
+       .json or .jsonl, a JSON lines file"""
+    if path.endswith('.jsonl') or path.endswith('.json'):
+        return read_jsonl(path)
+    return read_csv(path)
+
+def validate_row (row):
+    """Validate row
+
+    Checks a row locally, without calling the server, and
+    returns the EndUser or ResellerUser object it describes.
+
+    Required columns are username, email, password and domain.
+    Optional columns are type (user or reseller, default user),
+    package and ip. Any other non-empty column is set as a
+    user property (e.g. bandwidth, quota).
+
+    Raises ValidationError if the row is not valid
+    """
+    if not isinstance(row, dict):
+        raise ValidationError("row is not an object")
+    # JSON lines may hold numbers or lists where strings are expected
+    for key in _reserved:
+        value = row.get(key)
+        if value is not None and not isinstance(value, basestring):
+            raise ValidationError("%s must be a string" % key)
+    for key in ('username', 'email', 'password', 'domain'):
+        if not row.get(key):
+            raise ValidationError("missing %s" % key)
+    if not USERNAME_RE.match(row['username']):
+        raise ValidationError("invalid username: %s" % row['username'])
+    if not EMAIL_RE.match(row['email']):
+        raise ValidationError("invalid email: %s" % row['email'])
+    if len(row['password']) < 5:
+        raise ValidationError("password is too short")
+    if not DOMAIN_RE.match(row['domain']):
+        raise ValidationError("invalid domain: %s" % row['domain'])
+
+    kind = row.get('type') or 'user'
+    package = row.get('package') or None
+    if kind == 'user':
+        user = EndUser(row['username'], row['email'], row['password'], \
+                       row['domain'], package, row.get('ip') or None)
+    elif kind == 'reseller':
+        user = ResellerUser(row['username'], row['email'], \
+                            row['password'], row['domain'], package, \
+                            row.get('ip') or 'shared')
+    else:
+        raise ValidationError("invalid type: %s" % kind)
+
+    for key, value in row.items():
+        if key not in _reserved and value not in (None, ''):
+            user[key] = value
+    return user
+
+class Provisioner (object):
+    """Provisioner
+
+    Streaming pipeline that creates users in bulk:
+    rows are read lazily, validated locally and created with
+    a bounded number of requests in flight. The outcome of
+    every row is written to a JSON lines log as soon as it
+    is known, so a large batch can be followed and resumed.
+
+    Usernames that already exist on the server are skipped,
+    using a single list_all_users call for the whole batch.
+
+    Usage:
+
+    provisioner = Provisioner(api, workers=8, log=open('out.jsonl', 'w'))
+    print provisioner.run(read_rows('customers.csv'))
+    """
+    def __init__ (self, api, workers=4, notify=False, log=None):
+        """Constructor
+
+        Parameters:
+        api -- Api object
+        workers -- number of accounts created at once (default: 4)
+        notify -- boolean: if true sends notification emails
+                  (default: False)
+        log -- file object where the outcome of every row
+               is written as a JSON line (default: None)
+        """
+        self._api = api
+        self._workers = int(workers)
+        self._notify = notify
+        self._log = log
+
+    def _create (self, user):
+        """Creates a user with the right API command"""
+        if isinstance(user, ResellerUser):
+            return self._api.create_reseller(user, self._notify)
+        return self._api.create_user(user, self._notify)
+
+    def _record (self, counts, line, username, status, error=None):
+        """Counts the outcome of a row and logs it"""
+        counts[status] += 1
+        if self._log is not None:
+            entry = {'line': line, 'username': username, 'status': status}
+            if error is not None:
+                entry['error'] = str(error)
+            self._log.write(json.dumps(entry) + "\n")
+            self._log.flush()
+
+    def _collect (self, counts, done):
+        """Records the outcome of a finished creation"""
+        future, line, username = done.get()
+        try:
+            future.result()
+        except Exception, e:
+            self._record(counts, line, username, 'failed', e)
+        else:
+            self._record(counts, line, username, 'created')
+
+    def run (self, rows):
+        """Run
+
+        Provisions all the rows and returns a dictionary
+        with the number of users created, skipped (already
+        existing or repeated), invalid and failed.
+
+        If reading the rows raises, the creations already
+        sent are waited for and logged before it propagates.
+
+        Parameters:
+        rows -- iterable of dictionaries, e.g. from read_rows
+        """
+        counts = {'created': 0, 'skipped': 0, 'invalid': 0, 'failed': 0}
+        existing = set(self._api.list_all_users())
+        done = Queue.Queue()
+        pool = WorkerPool(self._workers)
+        in_flight = 0
+        try:
+            for line, row in enumerate(rows, 1):
+                username = None
+                if isinstance(row, dict):
+                    username = row.get('username')
+                try:
+                    user = validate_row(row)
+                except ValidationError, e:
+                    self._record(counts, line, username, 'invalid', e)
+                    continue
+                if username in existing:
+                    self._record(counts, line, username, 'skipped')
+                    continue
+                existing.add(username)
+
+                # Keep the number of pending creations bounded
+                # so rows are not read faster than they are created
+                while in_flight >= self._workers * 2:
+                    in_flight -= 1
+                    self._collect(counts, done)
+                future = pool.submit(self._create, user)
+                future.add_done_callback(lambda f, line=line, \
+                                         username=username: \
+                                         done.put((f, line, username)))
+                in_flight += 1
+        finally:
+            # Also on errors, so every account created gets logged
+            while in_flight:
+                in_flight -= 1
+                self._collect(counts, done)
+            pool.shutdown()
+        return counts
@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+"""Rate limiting and adaptive concurrency control
+
+This file is part of python-directadmin.
+
+python-directadmin is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+python-directadmin is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with python-directadmin.  If not, see <http://www.gnu.org/licenses/>.
+
+All limiters implement the same interface, used by ApiConnector:
+acquire(timeout) is called before sending a command and blocks while
+the server must not receive more requests, returning False if that
+takes longer than timeout seconds (None waits forever), and
+release(latency, failed) is called once the response arrived (or the
+request failed at the HTTP level) with the time it took in seconds.
+failed is None if the client gave up before the server answered,
+e.g. because a Deadline expired, which says nothing about the load
+of the server.
+"""
+
+import time
+import threading
+
+class TokenBucket (object):
+    """Token Bucket
+
+    Limits the rate of requests sent to a server to `rate`
+    requests per second, allowing bursts of up to `burst`
+    requests after a quiet period.
+
+    Instances are safe to share between threads and between
+    the connectors of a same host.
+    """
+    def __init__ (self, rate, burst=None):
+        """Constructor
+
+        Parameters:
+        rate -- requests per second
+        burst -- maximum number of requests sent at once
+                 after a quiet period (default: rate, at least 1)
+        """
+        if rate <= 0:
+            raise ValueError("rate must be greater than zero")
+        if burst is None:
+            burst = max(1, rate)
+        self._rate = float(rate)
+        self._burst = float(burst)
+        self._tokens = self._burst
+        self._updated = time.time()
+        self._lock = threading.Lock()
+        self.throttled = 0
+
+    def _take (self):
+        """Takes a token if there is one available.
+           Returns the seconds to wait otherwise"""
+        self._lock.acquire()
+        try:
+            now = time.time()
+            self._tokens = min(self._burst, self._tokens + \
+                               (now - self._updated) * self._rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0
+            self.throttled += 1
+            return (1 - self._tokens) / self._rate
+        finally:
+            self._lock.release()
+
+    def acquire (self, timeout=None):
+        """Blocks until a request can be sent. Returns False,
+           without taking a token, if it would take longer
+           than timeout seconds"""
+        end = None
+        if timeout is not None:
+            end = time.time() + timeout
+        wait = self._take()
+        while wait > 0:
+            if end is not None and time.time() + wait > end:
+                return False
+            time.sleep(wait)
+            wait = self._take()
+        return True
+
+    def release (self, latency, failed=False):
+        """Token buckets do not depend on the responses"""
+        pass
+
+    def stats (self):
+        """Returns a dictionary with the limiter state"""
+        return {'rate': self._rate, \
+                'tokens': self._tokens, \
+                'throttled': self.throttled}
+
+class AdaptiveLimiter (object):
+    """Adaptive Limiter
+
+    Controls the number of requests in flight on a server
+    using AIMD (additive increase, multiplicative decrease):
+    while responses arrive in less than target_latency
+    seconds the limit grows by one request per round trip,
+    and when latency rises above the target or requests
+    fail, the limit is multiplied by `decrease`.
+
+    Optionally, a TokenBucket also caps the request rate.
+
+    Instances are safe to share between threads.
+    """
+    def __init__ (self, \
+                  initial=4, \
+                  minimum=1, \
+                  maximum=32, \
+                  target_latency=1.0, \
+                  decrease=0.5, \
+                  rate=None, \
+                  burst=None):
+        """Constructor
+
+        Parameters:
+        initial -- initial number of requests in flight (default: 4)
+        minimum -- lowest limit (default: 1)
+        maximum -- highest limit (default: 32)
+        target_latency -- seconds above which the server is
+                          considered overloaded (default: 1.0)
+        decrease -- factor applied to the limit on overload (default: 0.5)
+        rate -- if given, also limit the requests per second
+        burst -- burst for the rate limit (default: rate)
+        """
+        if not 0 < decrease < 1:
+            raise ValueError("decrease must be between 0 and 1")
+        self._limit = float(min(max(initial, minimum), maximum))
+        self._minimum = minimum
+        self._maximum = maximum
+        self._target_latency = target_latency
+        self._decrease = decrease
+        self._bucket = None
+        if rate is not None:
+            self._bucket = TokenBucket(rate, burst)
+        self._in_flight = 0
+        self._last_decrease = 0
+        self._condition = threading.Condition()
+        self.increases = 0
+        self.decreases = 0
+
+    def limit (self):
+        """Returns the current number of requests allowed in flight"""
+        return int(self._limit)
+
+    def acquire (self, timeout=None):
+        """Blocks until a request can be sent. Returns False
+           if it would take longer than timeout seconds"""
+        end = None
+        if timeout is not None:
+            end = time.time() + timeout
+        self._condition.acquire()
+        try:
+            while self._in_flight >= int(self._limit):
+                if end is None:
+                    self._condition.wait()
+                    continue
+                left = end - time.time()
+                if left <= 0:
+                    return False
+                self._condition.wait(left)
+            self._in_flight += 1
+        finally:
+            self._condition.release()
+        # The token is taken last, so none is wasted
+        # waiting for a slot that never frees
+        if self._bucket is not None:
+            left = None
+            if end is not None:
+                left = max(0, end - time.time())
+            if not self._bucket.acquire(left):
+                self._condition.acquire()
+                try:
+                    self._in_flight -= 1
+                    self._condition.notifyAll()
+                finally:
+                    self._condition.release()
+                return False
+        return True
+
+    def release (self, latency, failed=False):
+        """Release
+
+        Frees the slot of a finished request and adapts the
+        limit to the latency and outcome of the request, unless
+        failed is None: the client gave up waiting for it
+        """
+        self._condition.acquire()
+        try:
+            self._in_flight -= 1
+            now = time.time()
+            if failed is None:
+                pass
+            elif failed or latency > self._target_latency:
+                # Requests that were already in flight when the limit
+                # was lowered should not lower it again
+                if now - self._last_decrease > latency:
+                    self._limit = max(self._minimum, \
+                                      self._limit * self._decrease)
+                    self._last_decrease = now
+                    self.decreases += 1
+            elif self._limit < self._maximum:
+                self._limit = min(self._maximum, \
+                                  self._limit + 1.0 / self._limit)
+                self.increases += 1
+            self._condition.notifyAll()
+        finally:
+            self._condition.release()
+
+    def stats (self):
+        """Returns a dictionary with the limiter state"""
+        self._condition.acquire()
+        try:
+            stats = {'limit': int(self._limit), \
+                     'in_flight': self._in_flight, \
+                     'increases': self.increases, \
+                     'decreases': self.decreases}
+        finally:
+            self._condition.release()
+        if self._bucket is not None:
+            stats['throttled'] = self._bucket.throttled
+        return stats
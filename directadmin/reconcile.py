@@ -0,0 +1,281 @@
+# -*- coding: utf-8 -*-
+"""Reconciliation of subdomains, POP accounts and databases
+with a declared desired state
+
+This file is part of python-directadmin.
+
+python-directadmin is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+python-directadmin is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with python-directadmin.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from futures import WorkerPool
+
+def _names (response):
+    """Returns the names of a list response, or an empty
+       list for the responses of servers with nothing to list"""
+    if isinstance(response, list):
+        return response
+    if isinstance(response, dict):
+        return response.keys()
+    return []
+
+def _short_name (database):
+    """Strips the 'username_' prefix Directadmin adds
+       to the names of databases"""
+    if '_' in database:
+        return database.split('_', 1)[1]
+    return database
+
+def _check (desired):
+    """Raises ValueError if a POP account or database
+       to create is declared without a password"""
+    for domain, state in desired.get('domains', {}).items():
+        for name, options in state.get('pop_accounts', {}).items():
+            if not isinstance(options, dict) or not options.get('password'):
+                raise ValueError("POP account %s@%s has no password" % \
+                                 (name, domain))
+    for name, options in desired.get('databases', {}).items():
+        if not isinstance(options, dict) or not options.get('password'):
+            raise ValueError("database %s has no password" % name)
+
+class Action (object):
+    """Action
+
+    A single change of a plan: kind is 'subdomain',
+    'pop_account' or 'database' and action is 'create'
+    or 'delete'
+    """
+    __slots__ = ('action', 'kind', 'domain', 'name', 'options')
+
+    def __init__ (self, action, kind, domain, name, options=None):
+        self.action = action
+        self.kind = kind
+        self.domain = domain
+        self.name = name
+        self.options = options or {}
+
+    def __str__ (self):
+        if self.kind == 'subdomain':
+            target = "%s.%s" % (self.name, self.domain)
+        elif self.kind == 'pop_account':
+            target = "%s@%s" % (self.name, self.domain)
+        else:
+            target = self.name
+        return "%s %s %s" % (self.action, self.kind, target)
+
+    def __repr__ (self):
+        return "<Action %s>" % self
+
+class Plan (object):
+    """Plan
+
+    Changes needed to reach the desired state. An empty
+    plan means the server is already up to date
+    """
+    def __init__ (self, actions=None):
+        self.actions = list(actions or [])
+
+    def __len__ (self):
+        return len(self.actions)
+
+    def __iter__ (self):
+        return iter(self.actions)
+
+    def __str__ (self):
+        return "\n".join(str(action) for action in self.actions)
+
+class ReconcileResult (object):
+    """Reconcile Result
+
+    Outcome of applying a plan: the actions applied
+    and a list of (action, error) for the failed ones
+    """
+    def __init__ (self):
+        self.applied = []
+        self.failed = []
+
+    def ok (self):
+        """Returns True if every action was applied"""
+        return not self.failed
+
+class Reconciler (object):
+    """Reconciler
+
+    Brings the subdomains, POP accounts and databases of the
+    logged user to a desired state, declared as a dictionary:
+
+    {'domains': {'example.com': {'subdomains': ['blog', 'shop'],
+                                 'pop_accounts': {'info': {'password': 'secret',
+                                                           'quota': 50}}}},
+     'databases': {'shop': {'user': 'shop', 'password': 'secret'}}}
+
+    The current state is read once per domain (and once for
+    the databases), and only the missing items are created.
+    Items that exist on the server but are not declared are
+    deleted only if prune is True, databases in a single
+    request. Existing POP accounts and databases are not
+    modified, as their passwords cannot be read back.
+
+    Database names are given without the 'username_' prefix
+    Directadmin adds to them.
+
+    Usage:
+
+    reconciler = Reconciler(api, prune=True)
+    plan = reconciler.plan(desired)
+    print plan
+    result = reconciler.apply(plan)
+    """
+    def __init__ (self, api, prune=False, workers=4):
+        """Constructor
+
+        Parameters:
+        api -- Api object logged as the owner of the domains
+        prune -- boolean, if True undeclared items are deleted
+                 (default: False)
+        workers -- number of domains read at once (default: 4)
+        """
+        self._api = api
+        self._prune = prune
+        self._workers = int(workers)
+
+    def _current (self, desired):
+        """Reads the current state of the declared domains,
+           and of the databases if they are declared"""
+        domains = desired.get('domains', {})
+        pool = WorkerPool(self._workers)
+        try:
+            futures = {}
+            for domain, state in domains.items():
+                if 'subdomains' in state:
+                    futures[domain, 'subdomains'] = \
+                        pool.submit(self._api.list_subdomains, domain)
+                if 'pop_accounts' in state:
+                    futures[domain, 'pop_accounts'] = \
+                        pool.submit(self._api.list_pop_accounts, domain)
+            if 'databases' in desired:
+                futures[None, 'databases'] = \
+                    pool.submit(self._api.list_databases)
+            return dict((key, _names(future.result())) \
+                        for key, future in futures.items())
+        finally:
+            pool.shutdown()
+
+    def plan (self, desired):
+        """Plan
+
+        Reads the current state and returns the Plan
+        of the changes needed to reach the desired one.
+
+        Raises ValueError, before reading anything, if a POP
+        account or database is declared without a password
+
+        Parameters:
+        desired -- dictionary with the desired state
+        """
+        _check(desired)
+        current = self._current(desired)
+        actions = []
+        for domain in sorted(desired.get('domains', {})):
+            state = desired['domains'][domain]
+            if 'subdomains' in state:
+                actions.extend(self._diff('subdomain', domain, \
+                               dict.fromkeys(state['subdomains']), \
+                               current[domain, 'subdomains']))
+            if 'pop_accounts' in state:
+                actions.extend(self._diff('pop_account', domain, \
+                               state['pop_accounts'], \
+                               current[domain, 'pop_accounts']))
+        if 'databases' in desired:
+            existing = dict((_short_name(name), name) \
+                            for name in current[None, 'databases'])
+            for name in sorted(desired['databases']):
+                if name not in existing:
+                    actions.append(Action('create', 'database', None, name, \
+                                          desired['databases'][name]))
+            if self._prune:
+                for name in sorted(existing):
+                    if name not in desired['databases']:
+                        actions.append(Action('delete', 'database', None, \
+                                              existing[name]))
+        return Plan(actions)
+
+    def _diff (self, kind, domain, wanted, existing):
+        """Returns the actions turning the existing names
+           into the wanted ones (a dictionary of name -> options)"""
+        existing = set(existing)
+        actions = [Action('create', kind, domain, name, wanted[name]) \
+                   for name in sorted(wanted) if name not in existing]
+        if self._prune:
+            actions.extend([Action('delete', kind, domain, name) \
+                            for name in sorted(existing) \
+                            if name not in wanted])
+        return actions
+
+    def apply (self, plan):
+        """Apply
+
+        Applies the actions of a plan, continuing after
+        failures, and returns a ReconcileResult. Database
+        deletions are sent in a single request
+
+        Parameters:
+        plan -- Plan returned by the plan method
+        """
+        result = ReconcileResult()
+        databases = []
+        for action in plan:
+            if action.kind == 'database' and action.action == 'delete':
+                databases.append(action)
+                continue
+            try:
+                self._apply(action)
+            except Exception, e:
+                # e.g. KeyError for a hand made action without password
+                result.failed.append((action, e))
+            else:
+                result.applied.append(action)
+        if databases:
+            try:
+                self._api.delete_databases([action.name \
+                                            for action in databases])
+            except Exception, e:
+                result.failed.extend([(action, e) for action in databases])
+            else:
+                result.applied.extend(databases)
+        return result
+
+    def _apply (self, action):
+        """Sends the command of a single action"""
+        options = action.options or {}
+        if action.kind == 'subdomain':
+            if action.action == 'create':
+                self._api.create_subdomain(action.domain, action.name)
+            else:
+                self._api.delete_subdomain(action.domain, action.name)
+        elif action.kind == 'pop_account':
+            if action.action == 'create':
+                self._api.create_pop_account(action.domain, action.name, \
+                                             options['password'], \
+                                             options.get('quota', 0))
+            else:
+                self._api.delete_pop_account(action.domain, action.name)
+        else:
+            self._api.create_database(action.name, \
+                                      options.get('user', action.name), \
+                                      options['password'])
+
+    def reconcile (self, desired):
+        """Plans and applies the changes needed to reach
+           the desired state, returning a ReconcileResult"""
+        return self.apply(self.plan(desired))
@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+"""Compact typed records for API results
+
+This file is part of python-directadmin.
+
+python-directadmin is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+python-directadmin is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with python-directadmin.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+def parse_value (value):
+    """Parse value
+
+    Converts a value returned by Directadmin to a number
+    when possible. 'unlimited' is translated to None and
+    any other value is returned unchanged
+    """
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        pass
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        pass
+    if value == 'unlimited':
+        return None
+    return value
+
+class Record (object):
+    """Record
+
+    Base class for typed results. Known fields are stored in
+    slots with their values already parsed, and any field
+    not declared in _fields is kept in a small dictionary.
+    """
+    __slots__ = ('_extra',)
+    _fields = ()
+    _text_fields = ()
+
+    def __init__ (self, **values):
+        self._extra = None
+        for field in self._fields:
+            setattr(self, field, None)
+        for key, value in values.items():
+            self[key] = value
+
+    def from_response (cls, response):
+        """Builds a record from a response dictionary,
+           in which every value is a one-element list"""
+        record = cls()
+        for key, value in response.items():
+            if key in cls._text_fields:
+                record[key] = value[0]
+            else:
+                record[key] = parse_value(value[0])
+        return record
+    from_response = classmethod(from_response)
+
+    def __getitem__ (self, key):
+        if key in self._fields:
+            return getattr(self, key)
+        if self._extra is not None and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def __setitem__ (self, key, value):
+        if key in self._fields:
+            setattr(self, key, value)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def __contains__ (self, key):
+        return key in self._fields or \
+               (self._extra is not None and key in self._extra)
+
+    def get (self, key, default=None):
+        """Returns a field, or default if it is not present"""
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def as_dict (self):
+        """Returns a dictionary with all the fields"""
+        d = {}
+        if self._extra is not None:
+            d.update(self._extra)
+        for field in self._fields:
+            d[field] = getattr(self, field)
+        return d
+
+    def __eq__ (self, other):
+        return type(self) is type(other) and \
+               self.as_dict() == other.as_dict()
+
+    def __ne__ (self, other):
+        return not self.__eq__(other)
+
+    def __repr__ (self):
+        return "<%s %r>" % (self.__class__.__name__, self.as_dict())
+
+class DiskInfo (Record):
+    """Disk Info
+
+    Usage of one of the server's filesystems.
+    usedpercent is an integer (without the % sign)
+    """
+    _fields = ('filesystem', 'blocks', 'used', 'available', \
+               'usedpercent', 'mounted')
+    _text_fields = ('filesystem', 'mounted')
+    __slots__ = _fields
+
+    def parse (cls, value):
+        """Builds a DiskInfo from a 'filesystem:blocks:...' string
+           or from a dictionary with those keys"""
+        if isinstance(value, dict):
+            items = [value.get(field) for field in cls._fields]
+        else:
+            items = value.split(':', len(cls._fields) - 1)
+        record = cls()
+        for field, item in zip(cls._fields, items):
+            if field == 'usedpercent' and isinstance(item, basestring):
+                item = item.rstrip('%')
+            if field not in cls._text_fields:
+                item = parse_value(item)
+            setattr(record, field, item)
+        return record
+    parse = classmethod(parse)
+
+class ServerStats (Record):
+    """Server Stats
+
+    Result of get_server_stats. Disk information is
+    available as a list of DiskInfo records in disks
+    """
+    _fields = ('bandwidth', 'quota', 'vdomains', 'nsubdomains', \
+               'nemails', 'nemailf', 'nemailml', 'nemailr', 'mysql', \
+               'domainptr', 'ftp', 'nusers', 'nresellers', 'ndomains', \
+               'loadavg', 'RX', 'TX', 'disks')
+    _text_fields = ('loadavg',)
+    __slots__ = _fields
+
+    def from_response (cls, response):
+        """Builds the record from the response of CMD_API_ADMIN_STATS"""
+        if not isinstance(response, dict):
+            # Imported here, api imports this module
+            from api import ApiError
+            raise ApiError("Unexpected response for server stats: %r" \
+                           % (response,))
+        record = cls()
+        disks = []
+        for key, value in response.items():
+            value = value[0]
+            if key.startswith('disk'):
+                disks.append((_disk_number(key), DiskInfo.parse(value)))
+            elif key in cls._text_fields:
+                record[key] = value
+            else:
+                record[key] = parse_value(value)
+        # disk2 goes before disk10
+        disks.sort(key=lambda item: item[0])
+        record.disks = [disk for number, disk in disks]
+        return record
+    from_response = classmethod(from_response)
+
+def _disk_number (key):
+    """Returns the number of a 'diskN' key, for sorting"""
+    try:
+        return int(key[4:])
+    except ValueError:
+        return key[4:]
+
+class UserUsage (Record):
+    """User Usage
+
+    Result of get_user_usage
+    """
+    _fields = ('bandwidth', 'quota', 'vdomains', 'nsubdomains', \
+               'nemails', 'nemailf', 'nemailml', 'nemailr', 'mysql', \
+               'domainptr', 'ftp', 'db_quota', 'email_quota', \
+               'email_deliveries', 'inode')
+    __slots__ = _fields
+
+class UserLimits (Record):
+    """User Limits
+
+    Result of get_user_limits. Limits set to
+    'unlimited' are translated to None
+    """
+    _fields = ('bandwidth', 'quota', 'vdomains', 'nsubdomains', \
+               'nemails', 'nemailf', 'nemailml', 'nemailr', 'mysql', \
+               'domainptr', 'ftp', 'inode', 'aftp', 'cgi', 'php', \
+               'spam', 'ssl', 'ssh', 'cron', 'sysinfo', 'dnscontrol', \
+               'suspended', 'creator', 'username', 'email', 'domain', \
+               'package', 'ip', 'usertype')
+    _text_fields = ('creator', 'username', 'email', 'domain', \
+                    'package', 'ip', 'usertype')
+    __slots__ = _fields
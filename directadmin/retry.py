@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""Retry policies for transient failures
+
+This file is part of python-directadmin.
+
+python-directadmin is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+python-directadmin is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with python-directadmin.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import random
+
+from api import ApiHttpError
+
+def _selected (parameters):
+    """Returns the values of the selectN parameters"""
+    return [value for key, value in parameters \
+            if key.startswith('select') and key[6:].isdigit()]
+
+def _listed (response):
+    """Returns a list response, or an empty list for the
+       responses of servers that have nothing to list"""
+    if isinstance(response, list):
+        return response
+    return []
+
+def verify_account_created (api, cmd, parameters):
+    """Checks if the account of a create command exists"""
+    username = dict(parameters).get('username')
+    return username in _listed(api.list_all_users())
+
+def verify_users_selected (api, cmd, parameters):
+    """Checks if a deletion, suspension or unsuspension
+       of users already took effect"""
+    parameters = list(parameters)
+    options = dict(parameters)
+    users = _selected(parameters)
+    if options.get('delete') == 'yes':
+        existing = set(_listed(api.list_all_users()))
+        return not [user for user in users if user in existing]
+    suspended = options.get('dosuspend') == 'yes'
+    for user in users:
+        limits = api.get_user_limits(user)
+        if (limits.get('suspended', ['no'])[0] == 'yes') != suspended:
+            return False
+    return True
+
+def verify_subdomains (api, cmd, parameters):
+    """Checks if a subdomain was created or deleted"""
+    options = dict(parameters)
+    existing = _listed(api.list_subdomains(options['domain']))
+    if options.get('action') == 'create':
+        return options['subdomain'] in existing
+    if options.get('action') == 'delete':
+        return options['select0'] not in existing
+    return False
+
+def verify_pop_account (api, cmd, parameters):
+    """Checks if a POP account was created or deleted"""
+    options = dict(parameters)
+    existing = _listed(api.list_pop_accounts(options['domain']))
+    if options.get('action') == 'create':
+        return options['user'] in existing
+    if options.get('action') == 'delete':
+        return options['user'] not in existing
+    return False
+
+# Verifiers for the mutating commands that can be checked
+DEFAULT_VERIFIERS = {'CMD_API_ACCOUNT_ADMIN': verify_account_created, \
+                     'CMD_API_ACCOUNT_RESELLER': verify_account_created, \
+                     'CMD_API_ACCOUNT_USER': verify_account_created, \
+                     'CMD_API_SELECT_USERS': verify_users_selected, \
+                     'CMD_API_SUBDOMAINS': verify_subdomains, \
+                     'CMD_API_POP': verify_pop_account}
+
+class RetryPolicy (object):
+    """Retry Policy
+
+    Describes how commands are retried after transient
+    failures (network errors, timeouts and 408, 429 or 5xx
+    HTTP responses), waiting an exponential backoff with
+    jitter between attempts.
+
+    Read-only commands are simply sent again. Mutating
+    commands are only retried if there is a verifier for
+    them: a function(api, cmd, parameters) that checks on the
+    server whether the failed command took effect anyway.
+    If it did, the command is considered successful,
+    otherwise it is sent again. Without a verifier the
+    failure is raised right away.
+
+    Usage:
+
+    policy = RetryPolicy(attempts=5, verifiers=DEFAULT_VERIFIERS)
+    api = Api("admin", "password", "hostname.com", retry=policy)
+    """
+    def __init__ (self, \
+                  attempts=3, \
+                  backoff=0.5, \
+                  max_backoff=30, \
+                  jitter=True, \
+                  verifiers=None):
+        """Constructor
+
+        Parameters:
+        attempts -- maximum number of times a command is sent (default: 3)
+        backoff -- seconds to wait before the first retry,
+                   doubled on every retry (default: 0.5)
+        max_backoff -- maximum seconds between retries (default: 30)
+        jitter -- boolean, if True a random wait between zero and
+                  the backoff is used (default: True)
+        verifiers -- dictionary of command -> verifier function for
+                     mutating commands (default: None, no retries)
+        """
+        if attempts < 1:
+            raise ValueError("attempts must be greater than zero")
+        self.attempts = int(attempts)
+        self._backoff = backoff
+        self._max_backoff = max_backoff
+        self._jitter = jitter
+        self._verifiers = dict(verifiers or {})
+
+    def is_transient (self, error):
+        """Returns True if an error may go away by retrying:
+           network failures and some HTTP statuses, but not
+           responses that could not be decoded"""
+        if not isinstance(error, ApiHttpError):
+            return False
+        if error.network:
+            return True
+        return error.status is not None and \
+               (error.status >= 500 or error.status in (408, 429))
+
+    def get_verifier (self, cmd):
+        """Returns the verifier of a mutating command, or None"""
+        return self._verifiers.get(cmd)
+
+    def delay (self, retry):
+        """Returns the seconds to wait before a retry,
+           counting retries from zero"""
+        delay = min(self._max_backoff, self._backoff * (2 ** retry))
+        if self._jitter:
+            return random.uniform(0, delay)
+        return delay
@@ -0,0 +1,567 @@
+# -*- coding: utf-8 -*-
+"""Transports used by ApiConnector to talk to the server
+
+This file is part of python-directadmin.
+
+python-directadmin is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+python-directadmin is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with python-directadmin.  If not, see <http://www.gnu.org/licenses/>.
+
+All transports implement the same interface:
+
+open(method, path, body, headers, stream, timeout) sends a request
+and returns a response object with status and reason attributes and
+info(), read([amt]) and close() methods, like the objects returned
+by urllib2.urlopen. HTTP error statuses are returned as responses,
+network failures raise socket.error, httplib.HTTPException or
+urllib2.URLError. If stream is False the body may be read in
+advance. timeout is the number of seconds socket operations may
+block, None for the default socket timeout; transports that open
+several connections for a request shorten it before every one to
+the time left by the current Deadline. The headers dictionary
+is shared by many requests and must not be modified.
+
+stats() returns a dictionary with counters, or None, and close()
+releases the resources held by the transport.
+"""
+
+import httplib
+import socket
+import threading
+import urllib
+import urllib2
+import weakref
+from StringIO import StringIO
+
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+from pool import ConnectionPool, PooledResponse, _set_timeout, \
+                 _cap_timeout, _is_dropped, _can_resend
+
+def _make_headers (headers):
+    """Builds a message object from a dictionary or list of pairs"""
+    if isinstance(headers, dict):
+        headers = headers.items()
+    lines = ["%s: %s\r\n" % (key, value) for key, value in headers or ()]
+    return httplib.HTTPMessage(StringIO("".join(lines) + "\r\n"))
+
+class Response (object):
+    """Response
+
+    Response with a body held in memory, returned
+    by the fake, recording and replay transports
+    """
+    def __init__ (self, status, reason, headers, body):
+        """Constructor
+
+        Parameters:
+        status -- HTTP status code
+        reason -- HTTP reason phrase
+        headers -- dictionary or list of (name, value) pairs
+        body -- response body string
+        """
+        self.status = status
+        self.reason = reason
+        self._headers = _make_headers(headers)
+        self._body = StringIO(body)
+
+    def info (self):
+        """Returns the response headers"""
+        return self._headers
+
+    def getcode (self):
+        """Returns the HTTP status code"""
+        return self.status
+
+    def read (self, amt=None):
+        """Reads up to amt bytes of the body (all if None)"""
+        if amt is None:
+            return self._body.read()
+        return self._body.read(amt)
+
+    def close (self):
+        pass
+
+class UrllibResponse (object):
+    """Wraps the objects returned by urllib2.urlopen,
+       and its HTTPError exceptions, as responses"""
+    def __init__ (self, response, reason="OK"):
+        self.status = response.getcode()
+        self.reason = reason
+        self._response = response
+
+    def info (self):
+        """Returns the response headers"""
+        return self._response.info()
+
+    def getcode (self):
+        """Returns the HTTP status code"""
+        return self.status
+
+    def read (self, amt=None):
+        """Reads up to amt bytes of the body (all if None)"""
+        if amt is None:
+            return self._response.read()
+        return self._response.read(amt)
+
+    def close (self):
+        self._response.close()
+
+class UrllibTransport (object):
+    """Urllib Transport
+
+    Opens a new connection with urllib2 for every request
+    """
+    def __init__ (self, hostname, port, https=False):
+        """Constructor
+
+        Parameters:
+        hostname -- Directadmin's hostname
+        port -- port on which Directadmin listens
+        https -- boolean, if True HTTPS is used (default: False)
+        """
+        if https:
+            protocol = "https"
+        else:
+            protocol = "http"
+        self._base_url = '%s://%s:%d' % (protocol, hostname, int(port))
+
+    def open (self, method, path, body=None, headers=None, stream=False, \
+              timeout=None):
+        """Sends a request and returns the response"""
+        request = urllib2.Request(self._base_url + path, body, headers or {})
+        if timeout is None:
+            timeout = socket.getdefaulttimeout()
+        try:
+            return UrllibResponse(urllib2.urlopen(request, timeout=timeout))
+        except urllib2.HTTPError, e:
+            return UrllibResponse(e, e.msg)
+
+    def stats (self):
+        return None
+
+    def close (self):
+        pass
+
+class PooledTransport (object):
+    """Pooled Transport
+
+    Sends requests through a ConnectionPool of
+    persistent (keep-alive) httplib connections
+    """
+    def __init__ (self, hostname, port, https=False, size=4, idle_timeout=60):
+        """Constructor
+
+        Parameters:
+        hostname -- Directadmin's hostname
+        port -- port on which Directadmin listens
+        https -- boolean, if True HTTPS is used (default: False)
+        size -- maximum number of idle connections kept open (default: 4)
+        idle_timeout -- seconds after which an idle connection
+                        is closed (default: 60)
+        """
+        self._pool = ConnectionPool(hostname, port, https, size, idle_timeout)
+
+    def open (self, method, path, body=None, headers=None, stream=False, \
+              timeout=None):
+        """Sends a request and returns the response"""
+        if stream:
+            return self._pool.open(method, path, body, headers, timeout)
+        return self._pool.request(method, path, body, headers, timeout)
+
+    def stats (self):
+        """Returns a dictionary with the pool counters"""
+        return self._pool.stats()
+
+    def close (self):
+        """Closes the idle connections"""
+        self._pool.close()
+
+class ConnectionStream (object):
+    """Response read incrementally from a connection of
+       its own, which is closed with the stream"""
+    def __init__ (self, conn, response):
+        self.status = response.status
+        self.reason = response.reason
+        self._conn = conn
+        self._response = response
+
+    def info (self):
+        """Returns the response headers"""
+        return self._response.msg
+
+    def getcode (self):
+        """Returns the HTTP status code"""
+        return self.status
+
+    def read (self, amt=None):
+        """Reads up to amt bytes of the body (all if None)"""
+        return self._response.read(amt)
+
+    def close (self):
+        self._conn.close()
+
+class _Slot (object):
+    """Holds the connection of a thread. Stored in a
+       threading.local, it goes away when the thread exits"""
+    __slots__ = ('conn', '__weakref__')
+
+    def __init__ (self):
+        self.conn = None
+
+class ThreadLocalTransport (object):
+    """Thread Local Transport
+
+    Keeps one persistent (keep-alive) httplib connection per
+    thread, so threads sharing an Api never wait for each
+    other nor take locks to send a request. Streams use a
+    connection of their own, so other commands can be sent
+    while a stream is being read.
+
+    The connection of a thread is closed when the thread
+    exits, so short lived worker threads do not leave
+    sockets open.
+
+    close() must only be called once the threads using the
+    transport are done.
+    """
+    def __init__ (self, hostname, port, https=False):
+        """Constructor
+
+        Parameters:
+        hostname -- Directadmin's hostname
+        port -- port on which Directadmin listens
+        https -- boolean, if True HTTPS is used (default: False)
+        """
+        self._hostname = hostname
+        self._port = int(port)
+        self._https = bool(https)
+        self._local = threading.local()
+        # Open connection -> weak reference to the slot of its thread
+        self._connections = {}
+        # Reentrant: slots may be collected while it is held
+        self._lock = threading.RLock()
+        self.connects = 0
+        self.reconnects = 0
+
+    def _new_connection (self):
+        """Opens a new connection to the server"""
+        if self._https:
+            return httplib.HTTPSConnection(self._hostname, self._port)
+        return httplib.HTTPConnection(self._hostname, self._port)
+
+    def _connect (self, slot):
+        """Gives the slot of the current thread a new connection"""
+        conn = slot.conn = self._new_connection()
+        ref = weakref.ref(slot, lambda ref, conn=conn: self._forget(conn))
+        self._lock.acquire()
+        try:
+            self._connections[conn] = ref
+            self.connects += 1
+        finally:
+            self._lock.release()
+        return conn
+
+    def _forget (self, conn):
+        """Closes a connection and stops tracking it"""
+        self._lock.acquire()
+        try:
+            self._connections.pop(conn, None)
+        finally:
+            self._lock.release()
+        conn.close()
+
+    def _drop (self, slot):
+        """Closes the connection of the current thread"""
+        conn, slot.conn = slot.conn, None
+        self._forget(conn)
+
+    def open (self, method, path, body=None, headers=None, stream=False, \
+              timeout=None):
+        """Sends a request and returns the response"""
+        headers = headers or {}
+        if stream:
+            conn = self._new_connection()
+            try:
+                _set_timeout(conn, _cap_timeout(timeout))
+                conn.request(method, path, body, headers)
+                return ConnectionStream(conn, conn.getresponse())
+            except:
+                conn.close()
+                raise
+
+        slot = getattr(self._local, 'slot', None)
+        if slot is None:
+            slot = self._local.slot = _Slot()
+        conn = slot.conn
+        # Closed by close() since it was last used
+        reused = conn is not None and conn in self._connections
+        if reused and _is_dropped(conn):
+            self._drop(slot)
+            reused = False
+        if not reused:
+            conn = self._connect(slot)
+        while True:
+            sent = False
+            try:
+                _set_timeout(conn, _cap_timeout(timeout))
+                conn.request(method, path, body, headers)
+                sent = True
+                response = conn.getresponse()
+                data = response.read()
+            except (socket.error, httplib.HTTPException), e:
+                self._drop(slot)
+                # A kept-alive connection may have been closed by
+                # the server, try again once on a new one
+                if not reused or not _can_resend(method, e, sent):
+                    raise
+                self._lock.acquire()
+                self.reconnects += 1
+                self._lock.release()
+                conn = self._connect(slot)
+                reused = False
+                continue
+            if response.will_close:
+                self._drop(slot)
+            return PooledResponse(response.status, response.reason, \
+                                  response.msg, data)
+
+    def stats (self):
+        """Returns a dictionary with the number of open
+           connections, connections made and reconnects"""
+        self._lock.acquire()
+        try:
+            return {'connections': len(self._connections), \
+                    'connects': self.connects, \
+                    'reconnects': self.reconnects}
+        finally:
+            self._lock.release()
+
+    def close (self):
+        """Closes the connections of all the threads"""
+        self._lock.acquire()
+        try:
+            connections, self._connections = self._connections, {}
+        finally:
+            self._lock.release()
+        for conn in connections:
+            conn.close()
+
+# Parameters whose values are never written to recordings
+_secret_parameters = ('passwd', 'passwd2', 'oldpassword', \
+                      'password1', 'password2')
+_redacted = 'REDACTED'
+
+def _redact (body):
+    """Returns a url-encoded request body with the values of
+       the password parameters replaced, the rest left as is"""
+    if not body:
+        return body
+    parts = body.split('&')
+    for n, part in enumerate(parts):
+        name = part.split('=', 1)[0]
+        if urllib.unquote_plus(name) in _secret_parameters:
+            parts[n] = '%s=%s' % (name, _redacted)
+    return '&'.join(parts)
+
+def _command (path):
+    """Returns the command name of a request path"""
+    return path.lstrip('/').split('?', 1)[0]
+
+class FakeTransport (object):
+    """Fake Transport
+
+    In-process transport that never touches the network,
+    answering from a dictionary of canned responses and/or
+    a handler function.
+
+    Responses may be a body string, a tuple (status, body)
+    or a tuple (status, headers, body). Commands without a
+    response get a 404 status.
+
+    Usage:
+
+    transport = FakeTransport({'CMD_API_SHOW_ALL_USERS': 'list[]=admin'})
+    api = Api("admin", "password", transport=transport)
+    """
+    def __init__ (self, responses=None, handler=None):
+        """Constructor
+
+        Parameters:
+        responses -- dictionary of command name -> response (default: None)
+        handler -- function(method, path, body, headers) returning
+                   a response, used for the commands not found in
+                   responses (default: None)
+        """
+        self._responses = dict(responses or {})
+        self._handler = handler
+        self._lock = threading.Lock()
+        self.requests = 0
+
+    def open (self, method, path, body=None, headers=None, stream=False, \
+              timeout=None):
+        """Returns the canned response of a request"""
+        self._lock.acquire()
+        self.requests += 1
+        self._lock.release()
+        response = self._responses.get(_command(path))
+        if response is None and self._handler is not None:
+            response = self._handler(method, path, body, headers)
+        if response is None:
+            return Response(404, "Not Found", None, "")
+        if isinstance(response, basestring):
+            return Response(200, "OK", None, response)
+        status = response[0]
+        reason = httplib.responses.get(status, "")
+        if len(response) == 2:
+            return Response(status, reason, None, response[1])
+        return Response(status, reason, response[1], response[2])
+
+    def stats (self):
+        """Returns a dictionary with the number of requests"""
+        return {'requests': self.requests}
+
+    def close (self):
+        pass
+
+class RecordingTransport (object):
+    """Recording Transport
+
+    Sends requests through another transport and appends every
+    request/response pair to a JSON lines file, which can be
+    replayed with ReplayTransport. The Authorization header is
+    never recorded, and the values of the password parameters
+    (passwd, passwd2, oldpassword, password1 and password2)
+    are replaced in the request bodies.
+
+    Usage:
+
+    transport = RecordingTransport(UrllibTransport("host", 2222),
+                                   "session.jsonl")
+    api = Api("admin", "password", "host", transport=transport)
+    """
+    def __init__ (self, transport, output):
+        """Constructor
+
+        Parameters:
+        transport -- transport the requests are sent through
+        output -- path or file object where pairs are written
+        """
+        if isinstance(output, basestring):
+            output = open(output, 'ab')
+        self._transport = transport
+        self._output = output
+        self._lock = threading.Lock()
+
+    def open (self, method, path, body=None, headers=None, stream=False, \
+              timeout=None):
+        """Sends a request and records it with its response.
+           Responses are always read in advance"""
+        response = self._transport.open(method, path, body, headers, \
+                                        stream, timeout)
+        try:
+            data = response.read()
+        finally:
+            if hasattr(response, 'close'):
+                response.close()
+        response_headers = response.info().items()
+        # Bodies are kept as latin-1 so any byte survives JSON
+        entry = {'method': method, \
+                 'path': path, \
+                 'body': _redact(body), \
+                 'status': response.status, \
+                 'reason': response.reason, \
+                 'headers': response_headers, \
+                 'response': data.decode('latin-1')}
+        line = json.dumps(entry) + "\n"
+        self._lock.acquire()
+        try:
+            self._output.write(line)
+            self._output.flush()
+        finally:
+            self._lock.release()
+        return Response(response.status, response.reason, \
+                        response_headers, data)
+
+    def stats (self):
+        return self._transport.stats()
+
+    def close (self):
+        """Closes the wrapped transport and the output file"""
+        self._transport.close()
+        self._output.close()
+
+class ReplayTransport (object):
+    """Replay Transport
+
+    Answers requests with the responses recorded by
+    RecordingTransport, without touching the network.
+
+    Requests are matched by method, path and body, with the
+    passwords redacted as in the recording. When a
+    request was recorded several times its responses are
+    returned in the recorded order, starting over once all
+    of them were used. Requests never recorded get a 404
+    status.
+    """
+    def __init__ (self, source):
+        """Constructor
+
+        Parameters:
+        source -- path or file object of a recording
+        """
+        if isinstance(source, basestring):
+            source = open(source, 'rb')
+        self._recorded = {}
+        for line in source:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            key = (entry['method'], entry['path'], _redact(entry['body']))
+            response = (entry['status'], \
+                        entry['reason'].encode('latin-1'), \
+                        [(str(k), v.encode('latin-1')) \
+                         for k, v in entry['headers']], \
+                        entry['response'].encode('latin-1'))
+            self._recorded.setdefault(key, []).append(response)
+        self._next = dict((key, 0) for key in self._recorded)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def open (self, method, path, body=None, headers=None, stream=False, \
+              timeout=None):
+        """Returns the recorded response of a request"""
+        key = (method, path, _redact(body))
+        self._lock.acquire()
+        try:
+            responses = self._recorded.get(key)
+            if responses is None:
+                self.misses += 1
+                return Response(404, "Not Recorded", None, "")
+            self.hits += 1
+            index = self._next[key]
+            self._next[key] = (index + 1) % len(responses)
+        finally:
+            self._lock.release()
+        status, reason, response_headers, data = responses[index]
+        return Response(status, reason, response_headers, data)
+
+    def stats (self):
+        """Returns a dictionary with the replayed and unknown requests"""
+        return {'hits': self.hits, 'misses': self.misses}
+
+    def close (self):
+        pass
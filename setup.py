@@ -3,8 +3,8 @@
 import sys
 from distutils.core import setup
 
-if not hasattr(sys, 'version_info') or sys.version_info < (2,5,0):
-    raise SystemExit("python-directadmin requires Python 2.5 or higher to work")
+if not hasattr(sys, 'version_info') or sys.version_info < (2,7,0):
+    raise SystemExit("python-directadmin requires Python 2.7 or higher to work")
 
 _description = "python-directadmin is a Python implementation " \
                "of Directadmin Panel Control Web API."
@@ -19,7 +19,8 @@ setup(name='python-directadmin', \
       url='http://code.google.com/p/python-directadmin/', \
       download_url='http://code.google.com/p/python-directadmin/downloads/list', \
       packages=['directadmin'], \
-      scripts=['scripts/da_suspension', 'scripts/da_console'], \
+      scripts=['scripts/da_suspension', 'scripts/da_console', \
+               'scripts/da_provision', 'scripts/da_exporter'], \
       platforms=['POSIX'], \
       classifiers=[
         'Development Status :: 3 - Alpha', \